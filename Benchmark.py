@@ -0,0 +1,406 @@
+"""Micro-benchmarks for the fuzzing components.
+
+Run as `python Benchmark.py [name ...]`; without arguments, all benchmarks
+are run.  Each benchmark prints one line per measured variant."""
+import sys
+import time
+import shutil
+from typing import Callable, Dict
+
+
+def measure(label: str, function: Callable[[], None], trials: int,
+            executions: int = 1) -> float:
+    """Run `function` `trials` times, print and return executions/second.
+       `executions` is the number of executions done by one call."""
+    start = time.perf_counter()
+    for i in range(trials):
+        function()
+    elapsed = time.perf_counter() - start
+    rate = trials * executions / elapsed
+    print("%-40s %10.1f execs/sec" % (label, rate))
+    return rate
+
+
+# A C program reading its input from stdin, for `bench_runners`
+STDIN_TARGET = r'''
+#include <stdio.h>
+int main(void) {
+    char buf[256];
+    size_t n = fread(buf, 1, sizeof buf, stdin), digits = 0;
+    for (size_t i = 0; i < n; i++)
+        if (buf[i] >= '0' && buf[i] <= '9')
+            digits++;
+    printf("%zu digits\n", digits);
+    return 0;
+}
+'''
+
+
+def bench_runners(trials: int = 300) -> None:
+    """Compare `ProgramRunner`, `BinaryProgramRunner`, and, on an
+       instrumented C program, `NativeCoverageRunner` and `ForkServerRunner`"""
+    import os
+    import tempfile
+    from Fuzz import ProgramRunner, BinaryProgramRunner
+    from Native import compile_instrumented, NativeCoverageRunner, ForkServerRunner
+    program = "bc" if shutil.which("bc") else "cat"
+    inp = "2 + 2\n"
+
+    for runner in [ProgramRunner(program), BinaryProgramRunner(program)]:
+        measure("%s(%r)" % (type(runner).__name__, program),
+                lambda: runner.run(inp), trials)
+
+    if not shutil.which("cc"):
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'digits.c')
+        with open(source, 'w') as f:
+            f.write(STDIN_TARGET)
+        executable = compile_instrumented(source, os.path.join(directory, 'digits'))
+        for runner in [BinaryProgramRunner(executable),
+                       NativeCoverageRunner(executable, argument=False),
+                       ForkServerRunner(executable)]:
+            measure("%s(digits)" % type(runner).__name__,
+                    lambda: runner.run(inp), trials)
+            if hasattr(runner, 'close'):
+                runner.close()
+
+
+def bench_parallel(trials: int = 4000) -> None:
+    """Compare a serial greybox campaign against `ParallelFuzzer`"""
+    import os
+    from Greybox import CountingGreyboxFuzzer, Mutator, AFLFastSchedule
+    from Mutation import FunctionCoverageRunner, http_program
+    from Parallel import ParallelFuzzer
+    seed = "http://www.google.com/search?q=fuzzing"
+
+    for processes in sorted({1, os.cpu_count() or 1}):
+        fuzzer = CountingGreyboxFuzzer([seed], Mutator(), AFLFastSchedule(5))
+        runner = FunctionCoverageRunner(http_program)
+        parallel = ParallelFuzzer(fuzzer, processes=processes)
+        measure("ParallelFuzzer(processes=%d)" % processes,
+                lambda: parallel.runs(runner, trials), 1, trials)
+        print("%-40s %10d seeds" % ("", len(fuzzer.population)))
+
+
+def bench_coverage(trials: int = 2000) -> None:
+    """Compare the coverage backends of `FunctionCoverageRunner`"""
+    from Coverage import Coverage, SetCoverage, FastCoverage, EdgeCoverage, cgi_decode
+    from Mutation import FunctionRunner, FunctionCoverageRunner, http_program
+    targets = [(cgi_decode, "Hello+World%20%41%42" * 5),
+               (http_program, "http://www.google.com/search?q=fuzzing")]
+
+    for function, inp in targets:
+        runner = FunctionRunner(function)
+        measure("%s, no coverage" % function.__name__,
+                lambda: runner.run(inp), trials)
+        backends = {Coverage, SetCoverage, FastCoverage, EdgeCoverage}
+        for coverage_class in sorted(backends, key=lambda c: c.__name__):
+            runner = FunctionCoverageRunner(function, coverage_class)
+            measure("%s, %s" % (function.__name__, coverage_class.__name__),
+                    lambda: runner.run(inp), trials)
+
+
+def bench_novelty(trials: int = 3000) -> None:
+    """Compare frozenset coverage signatures against edge bitmaps"""
+    from Coverage import SetCoverage, BitmapCoverage, EdgeBitmap, MAP_SIZE
+    from Greybox import GreyboxFuzzer, Mutator, PowerSchedule
+    from Mutation import FunctionCoverageRunner, http_program
+    seed = "http://www.google.com/search?q=fuzzing"
+
+    variants = [(SetCoverage, 0), (BitmapCoverage, MAP_SIZE), (BitmapCoverage, 1 << 12)]
+    for coverage_class, map_size in variants:
+        label = "GreyboxFuzzer, %s" % coverage_class.__name__
+        if map_size:
+            BitmapCoverage.shared_bitmap = EdgeBitmap(map_size)
+            label += "(%d)" % map_size
+        fuzzer = GreyboxFuzzer([seed], Mutator(), PowerSchedule())
+        runner = FunctionCoverageRunner(http_program, coverage_class)
+        measure(label, lambda: fuzzer.run(runner), trials)
+        print("%-40s %10d seeds" % ("", len(fuzzer.population)))
+    BitmapCoverage.shared_bitmap = None
+
+
+def bench_pathid(trials: int = 3000) -> None:
+    """Compare the original pickle+MD5 path IDs against `getPathID`"""
+    import pickle
+    import hashlib
+    from html.parser import HTMLParser
+    from Greybox import getPathID, AFLFastSchedule, Seed
+    from Mutation import FunctionCoverageRunner
+
+    def md5_path_id(coverage):
+        return hashlib.md5(pickle.dumps(sorted(coverage))).hexdigest()
+
+    def my_parser(inp: str) -> None:
+        parser = HTMLParser()
+        parser.feed(inp)
+
+    runner = FunctionCoverageRunner(my_parser)
+    population = []
+    for inp in ["<html>", "<a href='x'>link</a>", "<!-- c -->", "<b>x</b>"] * 25:
+        runner.run(inp)
+        seed = Seed(inp)
+        seed.coverage = runner.coverage()
+        population.append(seed)
+    coverage = population[1].coverage
+
+    # Per trial: one path ID of the run's coverage
+    measure("md5_path_id(%d locations)" % len(coverage),
+            lambda: md5_path_id(coverage), trials)
+    measure("getPathID(%d locations)" % len(coverage),
+            lambda: getPathID(coverage), trials)
+
+    # Per choice: energy of every seed in the population
+    schedule = AFLFastSchedule(5)
+    schedule.path_frequency = {path_id(seed.coverage): 1
+                               for seed in population
+                               for path_id in [md5_path_id, getPathID]}
+
+    def md5_energy() -> None:
+        for seed in population:
+            seed.energy = 1 / (schedule.path_frequency[md5_path_id(seed.coverage)]
+                               ** schedule.exponent)
+
+    measure("assignEnergy(%d seeds), MD5" % len(population), md5_energy, trials // 10)
+    measure("assignEnergy(%d seeds), cached" % len(population),
+            lambda: schedule.assignEnergy(population), trials // 10)
+
+
+def bench_schedule(trials: int = 2000) -> None:
+    """Compare O(n) and O(log n) seed selection in `AFLFastSchedule`"""
+    from Greybox import AFLFastSchedule, Seed
+
+    class ListAFLFastSchedule(AFLFastSchedule):
+        """Original behavior: assign all energies on every choice"""
+
+        def assignEnergy(self, population):
+            for seed in population:
+                seed.energy = self.seedEnergy(seed)
+
+    for size in [1000, 10000]:
+        population = []
+        for i in range(size):
+            seed = Seed(str(i))
+            seed.coverage = {('f', i % (size // 10))}
+            population.append(seed)
+        for schedule in [ListAFLFastSchedule(5), AFLFastSchedule(5)]:
+            for seed in population:
+                schedule.path_frequency[seed.path_id] = 1
+
+            def choose() -> None:
+                seed = schedule.choose(population)
+                schedule.count_path(seed.path_id)
+
+            choose()  # build the energy tree
+            measure("%s, %d seeds" % (type(schedule).__name__, size),
+                    choose, trials if size < 10000 else trials // 10)
+
+
+def bench_mutation(trials: int = 2000) -> None:
+    """Compare string mutations against in-place `ByteMutator` batches"""
+    from Greybox import Mutator, ByteMutator
+    seed = "http://www.google.com/search?q=fuzzing"
+    stack = 16  # mutations per candidate
+    batch = 32  # candidates per batch
+
+    mutator = Mutator()
+
+    def mutate_str() -> None:
+        candidate = seed
+        for i in range(stack):
+            candidate = mutator.mutate(candidate)
+
+    byte_mutator = ByteMutator()
+    measure("Mutator, %d stacked" % stack, mutate_str, trials)
+    measure("ByteMutator.mutate_many, %d stacked" % stack,
+            lambda: byte_mutator.mutate_many(seed, stack), trials)
+    measure("ByteMutator.mutate_batch(%d), %d stacked" % (batch, stack),
+            lambda: byte_mutator.mutate_batch(seed, [stack] * batch),
+            trials // batch, batch)
+
+
+def bench_directed(max_trials: int = 20000, repetitions: int = 3) -> None:
+    """Trials to solve a maze with undirected and directed schedules"""
+    import random
+    from Maze import generate_maze_code
+    from Callgraph import get_distances
+    from Mutation import FunctionCoverageRunner
+    from Greybox import (CountingGreyboxFuzzer, MazeMutator, AFLFastSchedule,
+                         DirectedSchedule, AnnealingSchedule)
+    maze_string = """
++-+-----+
+|X|     |
+| | --+ |
+| |   | |
+| +-- | |
+|     |#|
++-----+-+
+"""
+    maze_code = generate_maze_code(maze_string)
+    namespace: Dict = {}
+    exec(compile(maze_code, '<maze>', 'exec'), namespace)
+    distance = get_distances(maze_code, namespace['target_tile']())
+
+    schedules = [lambda: AFLFastSchedule(5),
+                 lambda: DirectedSchedule(distance, 50),
+                 lambda: AnnealingSchedule(distance, 50)]
+    for make_schedule in schedules:
+        results = []
+        for repetition in range(repetitions):
+            random.seed(repetition)
+            schedule = make_schedule()
+            fuzzer = CountingGreyboxFuzzer([" "], MazeMutator(list('UDLR')),
+                                           schedule)
+            runner = FunctionCoverageRunner(namespace['maze'])
+            for trial in range(1, max_trials + 1):
+                result, outcome = fuzzer.run(runner)
+                if "SOLVED" in result:
+                    break
+            results.append(trial)
+        print("%-40s %s trials" % (type(schedule).__name__,
+                                   " ".join("%6d" % n for n in results)))
+
+
+def bench_fairfuzz(trials: int = 10000, repetitions: int = 3) -> None:
+    """Edges of urlparse covered with and without rare-branch targeting"""
+    import random
+    from urllib.parse import urlparse
+    from Coverage import EdgeCoverage
+    from Mutation import FunctionCoverageRunner
+    from Greybox import (GreyboxFuzzer, CountingGreyboxFuzzer, FairGreyboxFuzzer,
+                         Mutator, MaskedMutator, PowerSchedule, AFLFastSchedule,
+                         RareBranchSchedule)
+    seed = "http://www.google.com/search?q=fuzzing"
+
+    fuzzers = [lambda: GreyboxFuzzer([seed], Mutator(), PowerSchedule()),
+               lambda: CountingGreyboxFuzzer([seed], Mutator(), AFLFastSchedule(5)),
+               lambda: FairGreyboxFuzzer([seed], MaskedMutator(), RareBranchSchedule())]
+    for make_fuzzer in fuzzers:
+        results = []
+        for repetition in range(repetitions):
+            random.seed(repetition)
+            fuzzer = make_fuzzer()
+            runner = FunctionCoverageRunner(urlparse, EdgeCoverage, include=['urllib'])
+            fuzzer.runs(runner, trials=trials)
+            results.append(len(fuzzer.cumulative.all_coverage))
+        print("%-40s %s edges" % (type(fuzzer).__name__,
+                                  " ".join("%6d" % n for n in results)))
+
+
+def bench_dominators(trials: int = 3) -> None:
+    """Compare iterative set intersection with Cooper-Harvey-Kennedy
+       dominators on maze CFGs of increasing size"""
+    from Maze import generate_maze_code
+    from Callgraph import get_cfg, compute_dominator
+
+    def set_dominator(cfg, start=0, key='parents'):
+        """Original implementation"""
+        dominator = {}
+        dominator[start] = {start}
+        all_nodes = set(cfg.keys())
+        rem_nodes = all_nodes - {start}
+        for n in rem_nodes:
+            dominator[n] = all_nodes
+        c = True
+        while c:
+            c = False
+            for n in rem_nodes:
+                pred_n = cfg[n][key]
+                doms = [dominator[p] for p in pred_n]
+                i = set.intersection(*doms) if doms else set()
+                v = {n} | i
+                if dominator[n] != v:
+                    c = True
+                dominator[n] = v
+        return dominator
+
+    for size in [4, 8, 16]:
+        rows = ["|" + " " * size + "|" for row in range(size)]
+        rows[0] = "|X" + rows[0][2:]
+        rows[-1] = rows[-1][:-2] + "#|"
+        border = "+" + "-" * size + "+"
+        maze_string = "\n".join([border] + rows + [border])
+        cfg, first, last = get_cfg(generate_maze_code(maze_string))
+        for function in [set_dominator, compute_dominator]:
+            def dominators() -> None:
+                function(cfg, first)
+                function(cfg, last, key='children')
+
+            measure("%s, %d nodes" % (function.__name__, len(cfg)),
+                    dominators, trials)
+
+
+def bench_startup(trials: int = 10) -> None:
+    """Time to start a fresh interpreter and import each module"""
+    import subprocess
+    for module in ['Fuzz', 'Coverage', 'Mutation', 'Greybox', 'Parallel',
+                   'Callgraph']:
+        measure("import %s" % module,
+                lambda: subprocess.run([sys.executable, '-c',
+                                        'import %s' % module], check=True),
+                trials)
+
+
+def bench_scope(trials: int = 3000) -> None:
+    """Trace everything vs. only the module under test"""
+    from Coverage import SetCoverage, FastCoverage
+    from Mutation import FunctionCoverageRunner, http_program
+    inp = "http://www.google.com/search?q=fuzzing"
+
+    for coverage_class in sorted({SetCoverage, FastCoverage}, key=lambda c: c.__name__):
+        for include in [None, ['Mutation']]:
+            runner = FunctionCoverageRunner(http_program, coverage_class,
+                                            include=include)
+            measure("%s, include=%s" % (coverage_class.__name__, include),
+                    lambda: runner.run(inp), trials)
+
+
+def bench_interned(trials: int = 3000) -> None:
+    """Per-trial coverage bookkeeping with tuple vs. interned locations"""
+    from html.parser import HTMLParser
+    from Coverage import SetCoverage, InternedCoverage, CumulativeCoverage
+    from Greybox import GreyboxFuzzer, Mutator, PowerSchedule
+    from Mutation import FunctionCoverageRunner
+
+    def my_parser(inp: str) -> None:
+        parser = HTMLParser()
+        parser.feed(inp)
+
+    inp = "<html><body><a href='x'>link</a><!-- c --></body></html>"
+    for coverage_class in [SetCoverage, InternedCoverage]:
+        runner = FunctionCoverageRunner(my_parser, coverage_class)
+        runner.run(inp)
+        coverage = runner.coverage()
+        seen = {frozenset(coverage)}
+        cumulative = CumulativeCoverage()
+        name = coverage_class.__name__
+        measure("%s, coverages_seen lookup" % name,
+                lambda: frozenset(runner.coverage()) in seen, trials * 10)
+        measure("%s, cumulative union" % name,
+                lambda: cumulative.add(runner.coverage()), trials * 10)
+        fuzzer = GreyboxFuzzer([inp], Mutator(), PowerSchedule())
+        measure("%s, GreyboxFuzzer" % name, lambda: fuzzer.run(runner), trials)
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    'runners': bench_runners,
+    'parallel': bench_parallel,
+    'coverage': bench_coverage,
+    'novelty': bench_novelty,
+    'pathid': bench_pathid,
+    'schedule': bench_schedule,
+    'mutation': bench_mutation,
+    'directed': bench_directed,
+    'fairfuzz': bench_fairfuzz,
+    'dominators': bench_dominators,
+    'startup': bench_startup,
+    'scope': bench_scope,
+    'interned': bench_interned,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print("== %s" % name)
+        BENCHMARKS[name]()
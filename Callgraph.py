@@ -6,9 +6,10 @@ sys.path.append(os.path.join(PROJ_DIR))
 # %%
 import ast
 import re
-
-# %%
-from graphviz import Source, Digraph
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
 
 # %% [markdown]
 # ### Registry
@@ -49,9 +50,13 @@ def get_registry():
 
 # %%
 class CFGNode(dict):
-    def __init__(self, parents=[], ast=None):
+    def __init__(self, parents=[], ast=None, registry=None):
         assert type(parents) is list
-        register_node(self)
+        if registry is None:
+            register_node(self)
+        else:
+            self.rid = len(registry)
+            registry[self.rid] = self
         self.parents = parents
         self.ast_node = ast
         self.update_children(parents)  # requires self.rid
@@ -121,12 +126,17 @@ class CFGNode(dict):
 # %%
 class PyCFG:
     def __init__(self):
-        self.founder = CFGNode(
+        self.registry = {}
+        self.founder = self.new_node(
             parents=[], ast=ast.parse('start').body[0])  # sentinel
         self.founder.ast_node.lineno = 0
         self.functions = {}
         self.functions_node = {}
 
+    def new_node(self, parents=[], ast=None):
+        """A `CFGNode` registered with this CFG only"""
+        return CFGNode(parents=parents, ast=ast, registry=self.registry)
+
 # %%
 class PyCFG(PyCFG):
     def parse(self, src):
@@ -162,7 +172,7 @@ class PyCFG(PyCFG):
         """
          AugAssign(expr target, operator op, expr value)
         """
-        p = [CFGNode(parents=myparents, ast=node)]
+        p = [self.new_node(parents=myparents, ast=node)]
         p = self.walk(node.value, p)
 
         return p
@@ -173,7 +183,7 @@ class PyCFG(PyCFG):
         """
         AnnAssign(expr target, expr annotation, expr? value, int simple)
         """
-        p = [CFGNode(parents=myparents, ast=node)]
+        p = [self.new_node(parents=myparents, ast=node)]
         p = self.walk(node.value, p)
 
         return p
@@ -187,7 +197,7 @@ class PyCFG(PyCFG):
         if len(node.targets) > 1:
             raise NotImplemented('Parallel assignments')
 
-        p = [CFGNode(parents=myparents, ast=node)]
+        p = [self.new_node(parents=myparents, ast=node)]
         p = self.walk(node.value, p)
 
         return p
@@ -195,7 +205,7 @@ class PyCFG(PyCFG):
 # %%
 class PyCFG(PyCFG):
     def on_pass(self, node, myparents):
-        return [CFGNode(parents=myparents, ast=node)]
+        return [self.new_node(parents=myparents, ast=node)]
 
 # %%
 class PyCFG(PyCFG):
@@ -206,7 +216,7 @@ class PyCFG(PyCFG):
             parent = parent.parents[0]
 
         assert hasattr(parent, 'exit_nodes')
-        p = CFGNode(parents=myparents, ast=node)
+        p = self.new_node(parents=myparents, ast=node)
 
         # make the break one of the parents of label node.
         parent.exit_nodes.append(p)
@@ -222,7 +232,7 @@ class PyCFG(PyCFG):
             # we have ordered parents
             parent = parent.parents[0]
         assert hasattr(parent, 'exit_nodes')
-        p = CFGNode(parents=myparents, ast=node)
+        p = self.new_node(parents=myparents, ast=node)
 
         # make continue one of the parents of the original test node.
         parent.add_parent(p)
@@ -246,11 +256,11 @@ class PyCFG(PyCFG):
         #     a = next(__iv)
         #     mystatements
 
-        init_node = CFGNode(parents=myparents,
+        init_node = self.new_node(parents=myparents,
             ast=ast.parse('__iv = iter(%s)' % ast.unparse(node.iter).strip()).body[0])
         ast.copy_location(init_node.ast_node, node.iter)
 
-        _test_node = CFGNode(
+        _test_node = self.new_node(
             parents=[init_node],
             ast=ast.parse('_for: __iv.__length__hint__() > 0').body[0])
         ast.copy_location(_test_node.ast_node, node)
@@ -259,7 +269,7 @@ class PyCFG(PyCFG):
         _test_node.exit_nodes = []
         test_node = self.walk(node.iter, [_test_node])
 
-        extract_node = CFGNode(parents=test_node,
+        extract_node = self.new_node(parents=test_node,
             ast=ast.parse('%s = next(__iv)' % ast.unparse(node.target).strip()).body[0])
         ast.copy_location(extract_node.ast_node, node.iter)
 
@@ -277,7 +287,7 @@ class PyCFG(PyCFG):
 class PyCFG(PyCFG):
     def on_while(self, node, myparents):
         # For a while, the earliest parent is the node.test
-        _test_node = CFGNode(
+        _test_node = self.new_node(
             parents=myparents,
             ast=ast.parse(
                 '_while: %s' % ast.unparse(node.test).strip()).body[0])
@@ -302,7 +312,7 @@ class PyCFG(PyCFG):
 # %%
 class PyCFG(PyCFG):
     def on_if(self, node, myparents):
-        _test_node = CFGNode(
+        _test_node = self.new_node(
             parents=myparents,
             ast=ast.parse(
                 '_if: %s' % ast.unparse(node.test).strip()).body[0])
@@ -336,21 +346,23 @@ class PyCFG(PyCFG):
     def on_unaryop(self, node, myparents):
         return self.walk(node.operand, myparents)
 
+# %%
+def get_func(node):
+    """The name of the function called by the `ast.Call` `node`"""
+    if type(node.func) is ast.Name:
+        mid = node.func.id
+    elif type(node.func) is ast.Attribute:
+        mid = node.func.attr
+    elif type(node.func) is ast.Call:
+        mid = get_func(node.func)
+    else:
+        raise Exception(str(type(node.func)))
+    return mid
+    #mid = node.func.value.id
+
 # %%
 class PyCFG(PyCFG):
     def on_call(self, node, myparents):
-        def get_func(node):
-            if type(node.func) is ast.Name:
-                mid = node.func.id
-            elif type(node.func) is ast.Attribute:
-                mid = node.func.attr
-            elif type(node.func) is ast.Call:
-                mid = get_func(node.func)
-            else:
-                raise Exception(str(type(node.func)))
-            return mid
-            #mid = node.func.value.id
-
         p = myparents
         for a in node.args:
             p = self.walk(a, p)
@@ -368,7 +380,7 @@ class PyCFG(PyCFG):
 # %%
 class PyCFG(PyCFG):
     def on_expr(self, node, myparents):
-        p = [CFGNode(parents=myparents, ast=node)]
+        p = [self.new_node(parents=myparents, ast=node)]
         return self.walk(node.value, p)
 
 # %%
@@ -385,7 +397,7 @@ class PyCFG(PyCFG):
             parent = parent.parents[0]
         assert hasattr(parent, 'return_nodes')
 
-        p = CFGNode(parents=val_node, ast=node)
+        p = self.new_node(parents=val_node, ast=node)
 
         # make the break one of the parents of label node.
         parent.return_nodes.append(p)
@@ -403,13 +415,13 @@ class PyCFG(PyCFG):
         args = node.args
         returns = node.returns
 
-        enter_node = CFGNode(
+        enter_node = self.new_node(
             parents=[],
             ast=ast.parse('enter: %s(%s)' % (node.name, ', '.join(
                 [a.arg for a in node.args.args]))).body[0])  # sentinel
         enter_node.calleelink = True
         ast.copy_location(enter_node.ast_node, node)
-        exit_node = CFGNode(
+        exit_node = self.new_node(
             parents=[],
             ast=ast.parse('exit: %s(%s)' % (node.name, ', '.join(
                 [a.arg for a in node.args.args]))).body[0])  # sentinel
@@ -448,7 +460,7 @@ class PyCFG(PyCFG):
 # %%
 class PyCFG(PyCFG):
     def link_functions(self):
-        for nid, node in REGISTRY.items():
+        for nid, node in self.registry.items():
             if node.calls:
                 for calls in node.calls:
                     if calls in self.functions:
@@ -478,13 +490,13 @@ class PyCFG(PyCFG):
 # %%
 class PyCFG(PyCFG):
     def update_functions(self):
-        for nid, node in REGISTRY.items():
+        for nid, node in self.registry.items():
             _n = self.get_defining_function(node)
 
 # %%
 class PyCFG(PyCFG):
     def update_children(self):
-        for nid, node in REGISTRY.items():
+        for nid, node in self.registry.items():
             for p in node.parents:
                 p.add_child(node)
 
@@ -498,7 +510,7 @@ class PyCFG(PyCFG):
         """
         node = self.parse(src)
         nodes = self.walk(node, [self.founder])
-        self.last_node = CFGNode(parents=nodes, ast=ast.parse('stop').body[0])
+        self.last_node = self.new_node(parents=nodes, ast=ast.parse('stop').body[0])
         ast.copy_location(self.last_node.ast_node, self.founder.ast_node)
         self.update_children()
         self.update_functions()
@@ -507,26 +519,83 @@ class PyCFG(PyCFG):
 # %% [markdown]
 # ### Supporting Functions
 
+# %%
+def compute_idom(cfg, start=0, key='parents'):
+    """Immediate dominators by the algorithm of Cooper, Harvey and Kennedy.
+    `key` names the predecessors ('parents', or 'children' for
+    post-dominators).  Nodes without predecessors other than `start` are
+    roots of their own tree; they, and nodes reached from several roots,
+    map to None.  Nodes not reachable from any root are left out."""
+    succ_key = 'children' if key == 'parents' else 'parents'
+    roots = [start] + [n for n in cfg if n != start and not cfg[n][key]]
+    root_set = set(roots)
+
+    # Number the nodes in postorder (iterative depth-first search)
+    order = {None: len(cfg)}
+    postorder = []
+    for root in roots:
+        if root in order:
+            continue
+        order[root] = -1
+        stack = [(root, iter(cfg[root][succ_key]))]
+        while stack:
+            node, successors = stack[-1]
+            for s in successors:
+                if s not in order and s in cfg:
+                    order[s] = -1
+                    stack.append((s, iter(cfg[s][succ_key])))
+                    break
+            else:
+                stack.pop()
+                order[node] = len(postorder)
+                postorder.append(node)
+
+    idom = {root: None for root in roots}
+
+    def intersect(a, b):
+        while a != b:
+            while order[a] < order[b]:
+                a = idom[a]
+            while order[b] < order[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for n in reversed(postorder):
+            if n in root_set:
+                continue
+            processed = [p for p in cfg[n][key] if p in idom]
+            if not processed:
+                continue
+            new_idom = processed[0]
+            for p in processed[1:]:
+                new_idom = intersect(p, new_idom)
+            if n not in idom or idom[n] != new_idom:
+                idom[n] = new_idom
+                changed = True
+    return idom
+
 # %%
 def compute_dominator(cfg, start=0, key='parents'):
-    dominator = {}
-    dominator[start] = {start}
+    """The set of dominators of each node, derived from `compute_idom()`"""
+    idom = compute_idom(cfg, start, key)
+    dominator = {None: set()}
+    for n in idom:
+        path = []
+        while n not in dominator:
+            path.append(n)
+            n = idom[n]
+        doms = dominator[n]
+        for m in reversed(path):
+            doms = doms | {m}
+            dominator[m] = doms
+    del dominator[None]
     all_nodes = set(cfg.keys())
-    rem_nodes = all_nodes - {start}
-    for n in rem_nodes:
-        dominator[n] = all_nodes
-
-    c = True
-    while c:
-        c = False
-        for n in rem_nodes:
-            pred_n = cfg[n][key]
-            doms = [dominator[p] for p in pred_n]
-            i = set.intersection(*doms) if doms else set()
-            v = {n} | i
-            if dominator[n] != v:
-                c = True
-            dominator[n] = v
+    for n in cfg:
+        if n not in dominator:  # not reachable from any root
+            dominator[n] = all_nodes
     return dominator
 
 # %%
@@ -536,12 +605,83 @@ def compute_flow(pythonfile):
         cfg, start=first), compute_dominator(
             cfg, start=last, key='children')
 
+# %% [markdown]
+# ### CFG Cache
+# CFGs are cached by the SHA-256 hash of their source, in memory with
+# least-recently-used eviction and, if `directory` is set, on disk.  Cached
+# CFGs are shared between callers; do not modify them.  Files on disk are
+# also keyed by `CFG_CACHE_VERSION`, to be increased whenever the CFG
+# construction changes, and by the Python version, whose `ast` the CFGs
+# are built from.
+
+# %%
+CFG_CACHE_VERSION = 1
+
+# %%
+class CFGCache:
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def file_name(self, key):
+        kind, digest = key
+        return os.path.join(self.directory, '%s-%s-v%d-py%d.%d.pickle' % (
+            kind, digest, CFG_CACHE_VERSION, *sys.version_info[:2]))
+
+    def load(self, key):
+        try:
+            with open(self.file_name(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def store(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_name = '%s.%d.tmp' % (self.file_name(key), os.getpid())
+        with open(tmp_name, 'wb') as f:
+            pickle.dump(value, f)
+        os.replace(tmp_name, self.file_name(key))
+
+    def lookup(self, kind, src, build, persistent=False):
+        """The cached `build(src)`; `persistent` results go to `directory`"""
+        key = (kind, hashlib.sha256(src.encode()).hexdigest())
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        persistent = persistent and self.directory is not None
+        value = self.load(key) if persistent else None
+        if value is None:
+            value = build(src)
+            if persistent:
+                self.store(key, value)
+
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# %%
+CFG_CACHE = CFGCache()
+
+# %%
+def build_cfg(src):
+    cfg = PyCFG()
+    cfg.gen_cfg(src)
+    return cfg
+
 # %%
 def gen_cfg(fnsrc, remove_start_stop=True):
-    reset_registry()
-    cfg = PyCFG()
-    cfg.gen_cfg(fnsrc)
-    cache = dict(REGISTRY)
+    cfg = CFG_CACHE.lookup('pycfg', fnsrc, build_cfg)
+    cache = dict(cfg.registry)
     if remove_start_stop:
         return {
             k: cache[k]
@@ -551,17 +691,13 @@ def gen_cfg(fnsrc, remove_start_stop=True):
         return cache
 
 # %%
-def get_cfg(src):
-    reset_registry()
-    cfg = PyCFG()
-    cfg.gen_cfg(src)
-    cache = dict(REGISTRY)
+def build_cfg_json(src):
+    cfg = build_cfg(src)
     g = {}
-    for k, v in cache.items():
-        j = v.to_json()
-        at = j['at']
-        parents_at = [cache[p].to_json()['at'] for p in j['parents']]
-        children_at = [cache[c].to_json()['at'] for c in j['children']]
+    for k, v in cfg.registry.items():
+        at = v.lineno()
+        parents_at = [p.lineno() for p in v.parents]
+        children_at = [c.lineno() for c in v.children]
         if at not in g:
             g[at] = {'parents': set(), 'children': set()}
         # remove dummy nodes
@@ -574,8 +710,77 @@ def get_cfg(src):
         g[at]['function'] = cfg.functions_node[v.lineno()]
     return (g, cfg.founder.ast_node.lineno, cfg.last_node.ast_node.lineno)
 
+# %%
+def get_cfg(src):
+    return CFG_CACHE.lookup('cfg', src, build_cfg_json, persistent=True)
+
+# %% [markdown]
+# ### Distances for Directed Fuzzing
+# AFLGo-style distances of each `(function, line)` location to a target
+# function.  The function-level distance is the number of calls needed to
+# reach the target in the call graph.  A line calling function `g` has
+# distance `call_weight * (df(g) + 1)`; any other line gets the harmonic
+# mean of its CFG distance to the call sites it can reach (plus their own
+# distance).  Lines of the target function have distance 0.
+
+# %%
+def get_distances(src, target, call_weight=10):
+    cfg, first, last = get_cfg(src)
+
+    # Function level: breadth-first search from the target, backwards
+    callers = {}
+    for node in cfg.values():
+        for callee in node.get('calls', []):
+            callers.setdefault(callee, set()).add(node['function'])
+    function_distance = {target: 0}
+    frontier = [target]
+    while frontier:
+        next_frontier = []
+        for function in frontier:
+            for caller in callers.get(function, ()):
+                if caller and caller not in function_distance:
+                    function_distance[caller] = function_distance[function] + 1
+                    next_frontier.append(caller)
+        frontier = next_frontier
+
+    # Line level: call sites, then backwards within each function
+    call_site_distance = {}
+    for line, node in cfg.items():
+        callees = [c for c in node.get('calls', [])
+                   if c in function_distance and c != node['function']]
+        if callees:
+            call_site_distance[line] = call_weight * (
+                min(function_distance[c] for c in callees) + 1)
+
+    inverse = {}  # line -> sum of 1/(distance to call site + its distance)
+    for site, site_distance in call_site_distance.items():
+        function = cfg[site]['function']
+        seen = {site: 0}
+        frontier = [site]
+        while frontier:
+            next_frontier = []
+            for line in frontier:
+                for parent in cfg[line]['parents']:
+                    if (parent not in seen and parent in cfg and
+                            cfg[parent].get('function') == function):
+                        seen[parent] = seen[line] + 1
+                        next_frontier.append(parent)
+            frontier = next_frontier
+        for line, steps in seen.items():
+            inverse[line] = inverse.get(line, 0) + 1 / (steps + site_distance)
+
+    distance = {}
+    for line, node in cfg.items():
+        function = node.get('function')
+        if function == target:
+            distance[(function, line)] = 0
+        elif line in inverse:
+            distance[(function, line)] = 1 / inverse[line]
+    return distance
+
 # %%
 def to_graph(cache, arcs=[]):
+    from graphviz import Digraph
     graph = Digraph(comment='Control Flow Graph')
     colors = {0: 'blue', 1: 'red'}
     kind = {0: 'T', 1: 'F'}
@@ -660,7 +865,8 @@ def check_triangle(a, b, c):
 import inspect
 
 # %%
-to_graph(gen_cfg(inspect.getsource(check_triangle)))
+if __name__ == '__main__':
+    to_graph(gen_cfg(inspect.getsource(check_triangle)))
 
 # %% [markdown]
 # #### cgi_decode
@@ -696,7 +902,8 @@ def cgi_decode(s):
     return t
 
 # %%
-to_graph(gen_cfg(inspect.getsource(cgi_decode)))
+if __name__ == '__main__':
+    to_graph(gen_cfg(inspect.getsource(cgi_decode)))
 
 # %% [markdown]
 # #### gcd
@@ -715,7 +922,8 @@ def gcd(a, b):
     return a
 
 # %%
-to_graph(gen_cfg(inspect.getsource(gcd)))
+if __name__ == '__main__':
+    to_graph(gen_cfg(inspect.getsource(gcd)))
 
 # %%
 def compute_gcd(x, y):
@@ -730,7 +938,8 @@ def compute_gcd(x, y):
     return gcd
 
 # %%
-to_graph(gen_cfg(inspect.getsource(compute_gcd)))
+if __name__ == '__main__':
+    to_graph(gen_cfg(inspect.getsource(compute_gcd)))
 
 # %% [markdown]
 # #### fib
@@ -745,7 +954,8 @@ def fib(n,):
     return ls
 
 # %%
-to_graph(gen_cfg(inspect.getsource(fib)))
+if __name__ == '__main__':
+    to_graph(gen_cfg(inspect.getsource(fib)))
 
 # %% [markdown]
 # #### quad_solver
@@ -769,60 +979,90 @@ def quad_solver(a, b, c):
     return ((r1,i1), (r2,i2))
 
 # %%
-to_graph(gen_cfg(inspect.getsource(quad_solver)))
+if __name__ == '__main__':
+    to_graph(gen_cfg(inspect.getsource(quad_solver)))
 
 # %% [markdown]
 # ## Call Graph
-# ### Install: Pyan Static Call Graph Lifter
+# The call graph is lifted from the AST: one node per module and per
+# function (named `<module>__<function>`, nested definitions joined by
+# `__`), and an edge from each function to every function of the same
+# source it calls.  Callees are resolved by name, as in `PyCFG.on_call()`.
 
 # %%
 import os
 
-# %%
-import networkx as nx  # type: ignore
-
 # %% [markdown]
 # ### Call Graph Helpers
 
 # %%
-import shutil
+class CallGraphBuilder(ast.NodeVisitor):
+    def __init__(self, name="callgraph"):
+        self.scope = [name]
+        self.defined = {}  # function name -> qualified node names
+        self.calls = {name: set()}  # qualified node name -> called names
 
-# %%
-PYAN = 'pyan3' if shutil.which('pyan3') is not None else 'pyan'
+    def visit_FunctionDef(self, node):
+        self.scope.append(node.name)
+        qualified = '__'.join(self.scope)
+        self.defined.setdefault(node.name, []).append(qualified)
+        self.calls.setdefault(qualified, set())
+        self.generic_visit(node)
+        self.scope.pop()
 
-if shutil.which(PYAN) is None:
-    # If installed from pypi, pyan may still be missing
-    os.system('pip install "git+https://github.com/uds-se/pyan#egg=pyan"')
-    PYAN = 'pyan3' if shutil.which('pyan3') is not None else 'pyan'
+    visit_AsyncFunctionDef = visit_FunctionDef
 
-assert shutil.which(PYAN) is not None
+    def visit_ClassDef(self, node):
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def visit_Call(self, node):
+        try:
+            self.calls['__'.join(self.scope)].add(get_func(node))
+        except Exception:
+            pass  # calls of subscripts, lambdas, etc.
+        self.generic_visit(node)
+
+    def adjacency(self):
+        """The call graph as a dict mapping each node to its callees"""
+        return {caller: {callee for name in called
+                         for callee in self.defined.get(name, [])}
+                for caller, called in self.calls.items()}
 
 # %%
 def construct_callgraph(code, name="callgraph"):
-    file_name = name + ".py"
-    with open(file_name, 'w') as f:
-        f.write(code)
-    cg_file = name + '.dot'
-    os.system(f'{PYAN} {file_name} --uses --defines --colored --grouped --annotated --dot > {cg_file}')
+    """The call graph of `code` as an adjacency dict, mapping every node to
+    the set of nodes it calls.  Results are cached in `CFG_CACHE`; do not
+    modify them.  See `get_callgraph()` for a networkx `DiGraph`."""
+    def build_callgraph(code):
+        builder = CallGraphBuilder(name)
+        builder.visit(ast.parse(code))
+        return builder.adjacency()
+    return CFG_CACHE.lookup('callgraph-%s' % name, code, build_callgraph)
 
 # %%
 def callgraph(code, name="callgraph"):
-    if not os.path.isfile(name + '.dot'):
-        construct_callgraph(code, name)
-    return Source.from_file(name + '.dot')
-
-# %% [markdown]
-# 
+    from graphviz import Digraph
+    graph = Digraph(comment='Call Graph')
+    adjacency = construct_callgraph(code, name)
+    for caller in adjacency:
+        graph.node(caller, caller.split('__')[-1])
+        for callee in adjacency[caller]:
+            graph.edge(caller, callee)
+    return graph
 
 # %%
 def get_callgraph(code, name="callgraph"):
-    if not os.path.isfile(name + '.dot'):
-        construct_callgraph(code, name)
-
-    # This is deprecated:
-    # return nx.drawing.nx_pydot.read_dot(name + '.dot')
-    
-    return nx.nx_agraph.read_dot(name + '.dot')
+    """The call graph of `code` as a networkx `DiGraph`"""
+    import networkx as nx  # type: ignore
+    adjacency = construct_callgraph(code, name)
+    graph = nx.DiGraph()
+    graph.add_nodes_from(adjacency)
+    graph.add_edges_from((caller, callee)
+                         for caller, callees in adjacency.items()
+                         for callee in callees)
+    return graph
 
 # %% [markdown]
 # ### Example: Maze
@@ -951,33 +1191,21 @@ def generate_maze_code(maze, name="maze"):
 # Now you can generate the maze code for an arbitrary maze.
 
 # %%
-maze_code = generate_maze_code(maze_string)
-
-
+if __name__ == '__main__':
+    maze_code = generate_maze_code(maze_string)
 
 # %%
-exec(maze_code)
+if __name__ == '__main__':
+    exec(maze_code)
 
 # %%
-# Appending one more 'D', you have reached the target.
-print(maze("DDDDRRRRUULLUURRRRDDD"))
+if __name__ == '__main__':
+    # Appending one more 'D', you have reached the target.
+    print(maze("DDDDRRRRUULLUURRRRDDD"))
 
 # %% [markdown]
 # This is the corresponding call graph.
 
 # %%
-callgraph(maze_code)
-
-# %% [markdown]
-# ## Cleanup
-# 
-# We're done, so we clean up:
-
-# %%
-if os.path.exists('callgraph.dot'):
-    os.remove('callgraph.dot')
-
-if os.path.exists('callgraph.py'):
-    os.remove('callgraph.py')
-
-
+if __name__ == '__main__':
+    callgraph(maze_code)
@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import time
+from typing import List, Dict, Any, Tuple, Optional, IO
+from Coverage import VirginBits, is_interned
+from Greybox import Seed, AdvancedMutationFuzzer
+
+
+def _tuples(value: Any) -> Any:
+    """Turn (nested) JSON lists back into (hashable) tuples"""
+    if isinstance(value, list):
+        return tuple(_tuples(v) for v in value)
+    return value
+
+
+class CorpusDirectory:
+    """A corpus directory from which a campaign can be resumed.
+
+    Layout:
+    ```
+    queue/id_000000   the data of each seed, one file per seed
+    index.jsonl       one line per seed: file, length, path ID, coverage, energy;
+                      a seed updated later has another line for its file,
+                      a removed one a line {"file": ..., "removed": true}
+    state.json        path frequencies and trial count, replaced atomically
+    virgin            the edges seen in bitmap mode, replaced atomically
+    ```
+    Seeds are written as they are added.  Files are only fsync'ed on
+    `sync()`, which happens every `sync_every` seeds or `sync_interval`
+    seconds, whichever comes first; a crash loses at most the seeds since
+    the last sync.  Use as
+    ```
+    corpus = CorpusDirectory("corpus")
+    corpus.attach(fuzzer)   # resumes if "corpus" holds a previous campaign
+    fuzzer.runs(runner, trials=100000)
+    corpus.sync(fuzzer)
+    ```
+    """
+
+    def __init__(self, path: str, sync_every: int = 100,
+                 sync_interval: float = 30.0) -> None:
+        self.path = path
+        self.queue_path = os.path.join(path, 'queue')
+        self.index_path = os.path.join(path, 'index.jsonl')
+        self.state_path = os.path.join(path, 'state.json')
+        self.virgin_path = os.path.join(path, 'virgin')
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        os.makedirs(self.queue_path, exist_ok=True)
+
+        self.count = 0
+        self._index: Optional[IO[str]] = None
+        self._unsynced: List[str] = []
+        self._last_sync = time.monotonic()
+
+    def next_id(self) -> int:
+        """One more than the highest seed file number in the queue.  Index
+           lines may have been skipped on load, so their files still count."""
+        ids = [int(match.group(1)) for match in
+               map(re.compile(r'id_(\d+)$').match, os.listdir(self.queue_path))
+               if match is not None]
+        return max(ids, default=-1) + 1
+
+    def load(self) -> Tuple[List[Seed], Dict[Any, int], int]:
+        """Return the seeds, path frequencies and number of trials stored.
+           Index entries whose seed file is missing or of another length
+           are skipped; of several entries for a file, the last one counts.
+           Removed seeds are skipped.
+           The index may list seeds saved after the last `sync()` of the
+           state; their paths count as exercised once."""
+        entries: Dict[str, Seed] = {}  # by file, in order of first entry
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as index:
+                for line in index:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write at the end of the index
+                    if entry.get('removed'):
+                        entries.pop(entry['file'], None)
+                        continue
+                    try:
+                        with open(os.path.join(self.queue_path, entry['file']), 'rb') as f:
+                            data = f.read()
+                    except FileNotFoundError:
+                        continue
+                    if len(data) != entry['length']:
+                        continue
+                    seed = Seed(data.decode('utf-8', 'surrogatepass'))
+                    seed.coverage = set(_tuples(entry['coverage']))
+                    seed.energy = entry['energy']
+                    seed.file = entry['file']
+                    entries[seed.file] = seed
+        seeds = list(entries.values())
+
+        path_frequency: Dict[Any, int] = {}
+        trials = 0
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            path_frequency = {_tuples(path_id): count
+                              for path_id, count in state['path_frequency']}
+            trials = state['trials']
+        for seed in seeds:
+            path_frequency.setdefault(seed.path_id, 1)
+        return seeds, path_frequency, trials
+
+    def load_virgin_bits(self) -> Optional[VirginBits]:
+        """The edges seen in bitmap mode, if stored"""
+        try:
+            with open(self.virgin_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        virgin_bits = VirginBits(len(data))
+        virgin_bits.virgin[:] = data
+        return virgin_bits
+
+    def _write_atomically(self, path: str, data: bytes) -> None:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def attach(self, fuzzer: AdvancedMutationFuzzer) -> None:
+        """Make `fuzzer` save new seeds here.  If the directory holds a
+           previous campaign, restore its population, coverages seen and
+           path frequencies into `fuzzer` first."""
+        seeds, path_frequency, trials = self.load()
+        self.count = self.next_id()
+        if seeds:
+            fuzzer.population = seeds
+            if hasattr(fuzzer, 'coverages_seen'):
+                fuzzer.coverages_seen = set(frozenset(seed.coverage) for seed in seeds)
+            if hasattr(fuzzer, 'virgin_bits'):
+                fuzzer.virgin_bits = self.load_virgin_bits()
+            fuzzer.schedule.path_frequency = path_frequency
+            fuzzer.schedule.invalidate()
+            fuzzer.seed_index = len(fuzzer.seeds)  # seeds have been run before
+            fuzzer.trials = trials
+        else:
+            for seed in fuzzer.population:
+                self.add(seed)
+        fuzzer.corpus = self
+
+    def _write_entry(self, seed: Seed, data: bytes) -> None:
+        if self._index is None:
+            self._index = open(self.index_path, 'a', encoding='utf-8')
+        self._index.write(json.dumps({
+            'file': seed.file,
+            'length': len(data),
+            'path_id': seed.path_id,
+            'coverage': sorted(seed.coverage),
+            'energy': seed.energy,
+        }) + '\n')
+
+    def add(self, seed: Seed) -> None:
+        """Save `seed`"""
+        if is_interned(seed.coverage):
+            # A resumed campaign would read the ids of another process
+            raise ValueError("InternedCoverage ids are per process; "
+                             "use SetCoverage with CorpusDirectory")
+        seed.file = 'id_%06d' % self.count
+        data = seed.data.encode('utf-8', 'surrogatepass')
+        with open(os.path.join(self.queue_path, seed.file), 'wb') as f:
+            f.write(data)
+        self._write_entry(seed, data)
+        self._unsynced.append(seed.file)
+        self.count += 1
+
+    def update(self, seed: Seed) -> None:
+        """Save the changed data of `seed` (e.g. after trimming) over its
+           file.  Whichever data the file holds after a crash, an index
+           entry matches it."""
+        if seed.file is None:
+            self.add(seed)
+            return
+        data = seed.data.encode('utf-8', 'surrogatepass')
+        # The new entry is durable before the file changes; until then, the
+        # old entry matches the file
+        self._write_entry(seed, data)
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        self._write_atomically(os.path.join(self.queue_path, seed.file), data)
+
+    def remove(self, seed: Seed) -> None:
+        """Drop `seed` (e.g. after minimization) from the corpus"""
+        if seed.file is None:
+            return
+        if self._index is None:
+            self._index = open(self.index_path, 'a', encoding='utf-8')
+        self._index.write(json.dumps({'file': seed.file, 'removed': True}) + '\n')
+        if seed.file in self._unsynced:
+            self._unsynced.remove(seed.file)
+        try:
+            os.remove(os.path.join(self.queue_path, seed.file))
+        except FileNotFoundError:
+            pass
+        seed.file = None
+
+    def tick(self, fuzzer: AdvancedMutationFuzzer) -> None:
+        """Sync if enough seeds or time have accumulated; cheap otherwise"""
+        if (len(self._unsynced) >= self.sync_every or
+                (self._unsynced and
+                 time.monotonic() - self._last_sync >= self.sync_interval)):
+            self.sync(fuzzer)
+
+    def sync(self, fuzzer: Optional[AdvancedMutationFuzzer] = None) -> None:
+        """Make all seeds saved so far, and the state of `fuzzer`, durable"""
+        for name in self._unsynced:
+            fd = os.open(os.path.join(self.queue_path, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._unsynced = []
+        if self._index is not None:
+            self._index.flush()
+            os.fsync(self._index.fileno())
+
+        if fuzzer is not None:
+            state = {
+                'path_frequency': list(fuzzer.schedule.path_frequency.items()),
+                'trials': fuzzer.trials,
+            }
+            self._write_atomically(self.state_path, json.dumps(state).encode())
+            virgin_bits = getattr(fuzzer, 'virgin_bits', None)
+            if virgin_bits is not None:
+                self._write_atomically(self.virgin_path, bytes(virgin_bits.virgin))
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self._index is not None:
+            self._index.close()
+            self._index = None
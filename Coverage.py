@@ -1,7 +1,10 @@
 #Exercise 2:
 import sys,os
-from typing import Tuple, List, Any, Optional, Callable, Type, Set
-from types import FrameType, TracebackType
+import zlib
+import bisect
+import fnmatch
+from typing import Tuple, List, Any, Optional, Callable, Type, Set, Dict, Sequence, Iterable, FrozenSet
+from types import CodeType, FrameType, TracebackType
 import inspect
 Location = Tuple[str, int]
 
@@ -37,6 +40,74 @@ def cgi_decode(s: str) -> str:
             t += c
         i += 1
     return t
+
+
+_module_names: Dict[str, str] = {}  # file name -> module name
+
+
+def module_name(filename: str) -> str:
+    """The name of the loaded module defined in `filename`, or "" """
+    name = _module_names.get(filename)
+    if name is None:
+        for loaded_name, module in list(sys.modules.items()):
+            module_file = getattr(module, '__file__', None)
+            if module_file is not None:
+                _module_names.setdefault(module_file, loaded_name)
+        name = _module_names.setdefault(filename, "")
+    return name
+
+
+class Scope:
+    """Which code to trace: code whose module or file name matches one of
+    the `include` patterns (all code if there are none), and none of the
+    `exclude` patterns.  A pattern matches a module and its submodules
+    (`'html'` matches `html.parser`), or is a shell-style pattern for module
+    or file names (`'*/site-packages/*'`).  The decision is cached per code
+    object, so every function is checked only once."""
+
+    def __init__(self, include: Sequence[str] = (),
+                 exclude: Sequence[str] = ()) -> None:
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self._traced: Dict[CodeType, bool] = {}
+
+    @staticmethod
+    def _matches(patterns: Sequence[str], module: str, filename: str) -> bool:
+        for pattern in patterns:
+            if (module == pattern or module.startswith(pattern + '.') or
+                    fnmatch.fnmatchcase(module, pattern) or
+                    fnmatch.fnmatchcase(filename, pattern)):
+                return True
+        return False
+
+    def __call__(self, code: CodeType) -> bool:
+        """Whether to trace `code`"""
+        traced = self._traced.get(code)
+        if traced is None:
+            filename = code.co_filename
+            module = module_name(filename)
+            traced = ((not self.include or
+                       self._matches(self.include, module, filename)) and
+                      not self._matches(self.exclude, module, filename))
+            self._traced[code] = traced
+        return traced
+
+
+_scopes: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], Scope] = {}
+
+
+def get_scope(include: Optional[Sequence[str]] = None,
+              exclude: Optional[Sequence[str]] = None) -> Optional[Scope]:
+    """The shared `Scope` for these patterns, or None if there are none"""
+    if not include and not exclude:
+        return None
+    key = (tuple(include or ()), tuple(exclude or ()))
+    scope = _scopes.get(key)
+    if scope is None:
+        scope = _scopes[key] = Scope(*key)
+    return scope
+
+
 class Coverage:
     """Track coverage within a `with` block. Use as
     ```
@@ -44,11 +115,17 @@ class Coverage:
         function_to_be_traced()
     c = cov.coverage()
     ```
+    With `include` and `exclude` patterns (see `Scope`), only code in these
+    modules or files is traced, e.g.
+    `Coverage(exclude=['urllib', 'html'])`.  Other frames are not traced at
+    all, so they run at (almost) full speed; their callees still are.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
         """Constructor"""
         self._trace: List[Location] = []
+        self.scope = get_scope(include, exclude)
 
     # Trace function
     def traceit(self, frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
@@ -61,6 +138,9 @@ class Coverage:
             lineno = frame.f_lineno
             if function_name != '__exit__':  # avoid tracing ourselves:
                 self._trace.append((function_name, lineno))
+        elif event == "call" and self.scope is not None:
+            if not self.scope(frame.f_code):
+                return None  # do not trace this frame
 
         return self.traceit
 
@@ -111,6 +191,266 @@ class Coverage:
 
         return t
 
+class SetCoverage(Coverage):
+    """Like `Coverage`, but only record the first execution of every line.
+    Repeated executions (loops) overwrite a dict entry instead of growing
+    the trace, and `trace()` returns the covered lines in first-hit order."""
+
+    def __init__(self, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        super().__init__(include, exclude)
+        self._lines: Dict[Location, None] = {}
+
+    def __enter__(self) -> Any:
+        self.original_trace_function = sys.gettrace()
+        original_trace_function = self.original_trace_function
+        lines = self._lines
+        scope = self.scope
+
+        # A closure avoids attribute lookups on every traced line
+        def traceit(frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+            if original_trace_function is not None:
+                original_trace_function(frame, event, arg)
+            if event == "line":
+                lines[(frame.f_code.co_name, frame.f_lineno)] = None
+            elif event == "call" and scope is not None and not scope(frame.f_code):
+                return None
+            return traceit
+
+        sys.settrace(traceit)
+        return self
+
+    def trace(self) -> List[Location]:
+        return [location for location in self._lines if location[0] != '__exit__']
+
+    def coverage(self) -> Set[Location]:
+        return set(self.trace())
+
+
+class MonitoringCoverage(SetCoverage):
+    """Track coverage using `sys.monitoring` (Python 3.12 and later).
+    Each line reports once and is then disabled until the next `with` block,
+    so loops and repeated calls run at full speed."""
+
+    TOOL_ID = 1  # sys.monitoring.COVERAGE_ID
+
+    def _line(self, code: Any, lineno: int) -> Any:
+        if code not in self._skip:
+            self._lines[(code.co_name, lineno)] = None
+        return sys.monitoring.DISABLE  # type: ignore
+
+    def _start(self, code: Any, offset: int) -> Any:
+        # With a scope, only functions in scope get line events
+        if self.scope(code):
+            sys.monitoring.set_local_events(  # type: ignore
+                self.TOOL_ID, code, sys.monitoring.events.LINE)  # type: ignore
+            self._enabled.append(code)
+        return sys.monitoring.DISABLE  # type: ignore
+
+    def __enter__(self) -> Any:
+        monitoring = sys.monitoring  # type: ignore
+        monitoring.use_tool_id(self.TOOL_ID, "Coverage")
+        # Like sys.settrace(), do not trace the frame of the `with` block
+        self._skip = {sys._getframe(1).f_code,
+                      MonitoringCoverage.__enter__.__code__,
+                      MonitoringCoverage.__exit__.__code__}
+        self._enabled: List[Any] = []  # code objects with local line events
+        monitoring.register_callback(self.TOOL_ID, monitoring.events.LINE, self._line)
+        monitoring.restart_events()
+        if self.scope is None:
+            monitoring.set_events(self.TOOL_ID, monitoring.events.LINE)
+        else:
+            monitoring.register_callback(self.TOOL_ID, monitoring.events.PY_START,
+                                         self._start)
+            monitoring.set_events(self.TOOL_ID, monitoring.events.PY_START)
+        return self
+
+    def __exit__(self, exc_type: Type, exc_value: BaseException,
+                 tb: TracebackType) -> Optional[bool]:
+        monitoring = sys.monitoring  # type: ignore
+        monitoring.set_events(self.TOOL_ID, monitoring.events.NO_EVENTS)
+        # Local events outlive the tool ID; a later scope must not see these
+        for code in self._enabled:
+            monitoring.set_local_events(self.TOOL_ID, code,
+                                        monitoring.events.NO_EVENTS)
+        self._enabled = []
+        monitoring.register_callback(self.TOOL_ID, monitoring.events.LINE, None)
+        monitoring.register_callback(self.TOOL_ID, monitoring.events.PY_START, None)
+        monitoring.free_tool_id(self.TOOL_ID)
+        return None
+
+
+# The fastest coverage backend available on this Python version
+FastCoverage: Type[Coverage] = MonitoringCoverage if hasattr(sys, 'monitoring') else SetCoverage
+
+
+MAP_SIZE = 1 << 16
+
+# AFL hit-count buckets: 0, 1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+
+COUNT_CLASS = bytes([0, 1, 2, 4] + [8] * 4 + [16] * 8 + [32] * 16 +
+                    [64] * 96 + [128] * 128)
+# Maps every non-zero byte to 0xff
+EDGE_CLASS = bytes([0] + [0xff] * 255)
+
+
+class EdgeBitmap:
+    """A fixed-size map of edge hit counts, as AFL's `trace_bits`.
+    `buffer` may be any writable buffer of `size` bytes, e.g. the `buf` of a
+    `multiprocessing.shared_memory.SharedMemory` block.  Writers that list
+    the indices they set in `touched` (as `BitmapCoverage` does) make
+    `clear()` and `VirginBits.has_new_bits()` cost O(edges hit) instead of
+    O(size)."""
+
+    def __init__(self, size: int = MAP_SIZE, buffer: Any = None) -> None:
+        assert size & (size - 1) == 0, "size must be a power of two"
+        self.size = size
+        self.bits = bytearray(size) if buffer is None else buffer
+        self._zero = bytes(size)
+        self.touched: Optional[List[int]] = None  # non-zero indices, if known
+
+    def clear(self) -> None:
+        touched = self.touched
+        if touched is not None and len(touched) < self.size >> 6:
+            bits = self.bits
+            for i in touched:
+                bits[i] = 0
+        else:
+            self.bits[:] = self._zero
+        if touched is not None:
+            touched.clear()
+
+    def classified(self) -> bytes:
+        """The map with hit counts replaced by their buckets"""
+        return bytes(self.bits).translate(COUNT_CLASS)
+
+    def edges(self) -> int:
+        """The number of edges hit"""
+        if self.touched is not None:
+            return len(self.touched)
+        return self.size - bytes(self.bits).count(0)
+
+
+# Maps 0xff (an edge never seen) to 0xff and everything else to 0
+UNSEEN_CLASS = bytes([0] * 255 + [0xff])
+
+
+class VirginBits:
+    """The (edge, hit-count bucket) pairs not seen so far, as AFL's
+    `virgin_bits`: one byte per edge, with the bits of the buckets not seen
+    yet.  Bitmaps listing their `touched` edges are checked edge by edge;
+    others are compared as big integers, which costs O(map size) per call,
+    with no per-edge Python code."""
+
+    def __init__(self, size: int = MAP_SIZE) -> None:
+        self.size = size
+        self.virgin = bytearray(b'\xff' * size)
+
+    def has_new_bits(self, bitmap: EdgeBitmap) -> int:
+        """Return 2 if `bitmap` hits a new edge, 1 if it only hits a known
+           edge with a new hit count bucket, and 0 otherwise."""
+        if bitmap.touched is not None:
+            return self._has_new_bits_sparse(bitmap)
+
+        classified = bitmap.classified()
+        trace = int.from_bytes(classified, 'little')
+        virgin = int.from_bytes(self.virgin, 'little')
+        if not trace & virgin:
+            return 0
+        edges = int.from_bytes(classified.translate(EDGE_CLASS), 'little')
+        unseen = int.from_bytes(bytes(self.virgin).translate(UNSEEN_CLASS), 'little')
+        self.virgin[:] = (virgin & ~trace).to_bytes(self.size, 'little')
+        return 2 if edges & unseen else 1
+
+    def _has_new_bits_sparse(self, bitmap: EdgeBitmap) -> int:
+        virgin = self.virgin
+        bits = bitmap.bits
+        result = 0
+        for i in bitmap.touched:  # type: ignore
+            bucket = COUNT_CLASS[bits[i]]
+            old = virgin[i]
+            if bucket & old:
+                if old == 0xff:
+                    result = 2
+                elif result == 0:
+                    result = 1
+                virgin[i] = old & ~bucket
+        return result
+
+
+def name_hash(name: str) -> int:
+    """The CRC-32 of a function name.  Unlike `hash()`, it is the same in
+    every process, so bitmaps and virgin bits can be saved and compared
+    across processes."""
+    return zlib.crc32(name.encode('utf-8', 'surrogatepass'))
+
+
+# `name_hash()` by name; a plain dict, as lookups happen on every line
+_name_hashes: Dict[str, int] = {}
+
+
+class BitmapCoverage(SetCoverage):
+    """Track coverage and, in addition, the hit counts of transitions
+    between lines in an `EdgeBitmap`.  Locations are hashed into the map
+    (from the cached CRC-32 of the function name and the line number, so
+    no tuple is hashed) and every transition increments
+    `bitmap[cur ^ (prev >> 1)]`, as in AFL.  By default, all instances
+    share one bitmap, which is cleared when entering the `with` block."""
+
+    shared_bitmap: Optional[EdgeBitmap] = None
+
+    def __init__(self, bitmap: Optional[EdgeBitmap] = None,
+                 include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        super().__init__(include, exclude)
+        if bitmap is None:
+            if BitmapCoverage.shared_bitmap is None:
+                BitmapCoverage.shared_bitmap = EdgeBitmap()
+            bitmap = BitmapCoverage.shared_bitmap
+        self.bitmap = bitmap
+        if bitmap.touched is None:
+            bitmap.touched = []
+
+    def __enter__(self) -> Any:
+        self.original_trace_function = sys.gettrace()
+        original_trace_function = self.original_trace_function
+        lines = self._lines
+        self.bitmap.clear()
+        bits = self.bitmap.bits
+        touched = self.bitmap.touched
+        mask = self.bitmap.size - 1
+        prev = 0
+        scope = self.scope
+        name_hashes = _name_hashes
+
+        def traceit(frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+            nonlocal prev
+            if original_trace_function is not None:
+                original_trace_function(frame, event, arg)
+            if event == "line":
+                name = frame.f_code.co_name
+                lineno = frame.f_lineno
+                lines[(name, lineno)] = None
+                try:
+                    cur = name_hashes[name]
+                except KeyError:
+                    cur = name_hashes[name] = name_hash(name)
+                cur = (cur ^ lineno * 0x9e3779b1) & mask
+                edge = cur ^ prev
+                count = bits[edge]
+                if count == 0:
+                    bits[edge] = 1
+                    touched.append(edge)
+                elif count != 0xff:
+                    bits[edge] = count + 1
+                prev = cur >> 1
+            elif event == "call" and scope is not None and not scope(frame.f_code):
+                return None
+            return traceit
+
+        sys.settrace(traceit)
+        return self
+
+
 def population_coverage(population: List[str], function: Callable) \
         -> Tuple[Set[Location], List[int]]:
     cumulative_coverage: List[int] = []
@@ -127,13 +467,230 @@ def population_coverage(population: List[str], function: Callable) \
 
     return all_coverage, cumulative_coverage
 
-class BranchCoverage(Coverage):
+class CumulativeCoverage:
+    """Cumulative coverage of a sequence of runs, as computed by
+    `population_coverage()`, but fed with the coverage of each run as it
+    happens, so no input has to be executed again.  Since cumulative
+    coverage only changes when new locations are covered, only these
+    steps are stored, with the locations first covered at each."""
+
     def __init__(self) -> None:
-        super().__init__()
+        self.all_coverage: Set[Location] = set()
+        self.steps: List[Tuple[int, int]] = []  # (run, coverage from this run on)
+        self.new_locations: List[Set[Location]] = []  # by step
+        self.runs = 0
+
+    def add(self, coverage: Set[Location]) -> None:
+        """Record the coverage of the next run"""
+        if not self.all_coverage.issuperset(coverage):
+            new = set(coverage).difference(self.all_coverage)
+            self.all_coverage.update(new)
+            self.steps.append((self.runs, len(self.all_coverage)))
+            self.new_locations.append(new)
+        self.runs += 1
+
+    def since(self, run: int) -> List[Tuple[int, Set[Location]]]:
+        """The (run, new locations) steps of the runs from `run` on, with
+           runs counted from `run`"""
+        first = bisect.bisect_left(self.steps, (run,))
+        return [(step_run - run, new) for (step_run, covered), new
+                in zip(self.steps[first:], self.new_locations[first:])]
+
+    def merge(self, steps: List[Tuple[int, Set[Location]]], runs: int) -> None:
+        """Record `runs` runs made elsewhere (e.g. in another process) after
+           the runs recorded so far, given as their `since()` steps"""
+        for run, locations in steps:
+            new = locations.difference(self.all_coverage)
+            if new:
+                self.all_coverage.update(new)
+                self.steps.append((self.runs + run, len(self.all_coverage)))
+                self.new_locations.append(new)
+        self.runs += runs
+
+    def cumulative_coverage(self) -> List[int]:
+        """The number of locations covered after each run"""
+        cumulative_coverage: List[int] = []
+        covered = 0
+        for run, new_covered in self.steps:
+            cumulative_coverage += [covered] * (run - len(cumulative_coverage))
+            covered = new_covered
+        cumulative_coverage += [covered] * (self.runs - len(cumulative_coverage))
+        return cumulative_coverage
+
+    def population_coverage(self) -> Tuple[Set[Location], List[int]]:
+        """Return `(all_coverage, cumulative_coverage)`, as `population_coverage()`"""
+        return self.all_coverage, self.cumulative_coverage()
+
+
+class BranchCoverage(Coverage):
+    def __init__(self, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        super().__init__(include, exclude)
 
     def branch_coverage(self) -> Set[Location]:
         subsequent = set()
         trace = self.trace()
-        for i in range(len(trace)-2):
+        for i in range(len(trace)-1):
             subsequent.add((trace[i], trace[i+1]))
         return subsequent
+
+
+Edge = Tuple[Location, Location]
+
+
+class EdgeCoverage(SetCoverage):
+    """Track transitions between lines, i.e. the pairs of consecutively
+    executed locations, and how often each was taken.  Edges are counted as
+    they happen, so memory is bounded by the number of distinct edges rather
+    than by the length of the run.  `coverage()` returns the set of edges;
+    use as `FunctionCoverageRunner(function, EdgeCoverage)`."""
+
+    def __init__(self, include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        super().__init__(include, exclude)
+        self._edges: Dict[Edge, int] = {}
+
+    def __enter__(self) -> Any:
+        self.original_trace_function = sys.gettrace()
+        original_trace_function = self.original_trace_function
+        edges = self._edges
+        prev: Optional[Location] = None
+        scope = self.scope
+
+        def traceit(frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+            nonlocal prev
+            if original_trace_function is not None:
+                original_trace_function(frame, event, arg)
+            if event == "line":
+                location = (frame.f_code.co_name, frame.f_lineno)
+                if prev is not None:
+                    edge = (prev, location)
+                    edges[edge] = edges.get(edge, 0) + 1
+                prev = location
+            elif event == "call" and scope is not None and not scope(frame.f_code):
+                return None
+            return traceit
+
+        sys.settrace(traceit)
+        return self
+
+    def hit_counts(self) -> Dict[Edge, int]:
+        """The number of times each edge was taken"""
+        return {edge: count for edge, count in self._edges.items()
+                if edge[0][0] != '__exit__' and edge[1][0] != '__exit__'}
+
+    def trace(self) -> List[Location]:
+        """The covered lines, in first-hit order"""
+        lines: Dict[Location, None] = {}
+        for edge in self.hit_counts():
+            lines[edge[0]] = None
+            lines[edge[1]] = None
+        return list(lines)
+
+    def coverage(self) -> Set[Edge]:  # type: ignore
+        return set(self.hit_counts())
+
+
+FullLocation = Tuple[str, str, int]  # (file name, function name, line number)
+
+
+class LocationTable(dict):
+    """Small integer ids of locations, assigned on first sight.  Ids are
+    only meaningful within the process (and the table) that assigned them;
+    `ParallelFuzzer`, `PersistentRunner` and `CorpusDirectory` reject them
+    (see `is_interned()`)."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.locations: List[FullLocation] = []
+
+    def __missing__(self, location: FullLocation) -> int:
+        value = self[location] = len(self.locations)
+        self.locations.append(location)
+        return value
+
+    def decode(self, ids: Iterable[int]) -> Set[Location]:
+        """The (function_name, line_number) locations of `ids`"""
+        locations = self.locations
+        return {locations[i][1:] for i in ids}  # type: ignore
+
+    def decode_bitset(self, bits: int) -> Set[int]:
+        """The ids set in the bitset `bits`"""
+        ids = set()
+        while bits:
+            low = bits & -bits
+            ids.add(low.bit_length() - 1)
+            bits ^= low
+        return ids
+
+
+# The table shared by all `InternedCoverage` instances by default
+LOCATIONS = LocationTable()
+
+
+class InternedCoverage(SetCoverage):
+    """Like `SetCoverage`, but locations include the file name and are
+    interned in a `LocationTable`: `coverage()` is a frozenset of small
+    ints, which are cheap to hash, compare and unite, and `bitset()` the
+    same as one int with a bit per location.  Use `table.decode()` to get
+    (function_name, line_number) locations back."""
+
+    def __init__(self, table: Optional[LocationTable] = None,
+                 include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        super().__init__(include, exclude)
+        self.table = table if table is not None else LOCATIONS
+        self._ids: Dict[int, None] = {}
+
+    def __enter__(self) -> Any:
+        self.original_trace_function = sys.gettrace()
+        original_trace_function = self.original_trace_function
+        ids = self._ids
+        table = self.table
+        scope = self.scope
+        exit_code = Coverage.__exit__.__code__
+
+        def traceit(frame: FrameType, event: str, arg: Any) -> Optional[Callable]:
+            if original_trace_function is not None:
+                original_trace_function(frame, event, arg)
+            if event == "line":
+                code = frame.f_code
+                ids[table[(code.co_filename, code.co_name, frame.f_lineno)]] = None
+            elif event == "call":
+                # Do not trace ourselves, nor frames out of scope
+                code = frame.f_code
+                if code is exit_code or (scope is not None and not scope(code)):
+                    return None
+            return traceit
+
+        sys.settrace(traceit)
+        return self
+
+    def trace(self) -> List[Location]:
+        locations = self.table.locations
+        return [locations[i][1:] for i in self._ids]  # type: ignore
+
+    def function_names(self) -> Set[str]:
+        return set(function_name for (function_name, line_number) in self.trace())
+
+    def coverage(self) -> FrozenSet[int]:  # type: ignore
+        return frozenset(self._ids)
+
+    def bitset(self) -> int:
+        bits = 0
+        for i in self._ids:
+            bits |= 1 << i
+        return bits
+
+
+def is_interned(coverage: Iterable[Any]) -> bool:
+    """Whether `coverage` holds `LocationTable` ids rather than locations"""
+    for location in coverage:
+        return isinstance(location, int)
+    return False
+
+
+def uses_interned_coverage(runner: Any) -> bool:
+    """Whether `runner` records coverage with `InternedCoverage`"""
+    coverage_class = getattr(runner, 'coverage_class', None)
+    return isinstance(coverage_class, type) and issubclass(coverage_class, InternedCoverage)
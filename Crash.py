@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import signal
+import hashlib
+import traceback
+from typing import List, Dict, Any, Optional, Tuple, Set
+from Fuzz import Runner
+
+Frame = Tuple[str, str, int]  # (file name, function name, line number)
+
+# A frame of an AddressSanitizer/UndefinedBehaviorSanitizer stack trace
+SANITIZER_FRAME = re.compile(r'\s*#\d+ 0x[0-9a-f]+ in (\S+) (\S+?):(\d+)')
+# The headline of a sanitizer report, e.g. "heap-buffer-overflow"
+SANITIZER_ERROR = re.compile(r'ERROR: \w+Sanitizer: ([\w-]+)')
+
+
+def exception_frames(exception: BaseException, frames: int = 5) -> List[Frame]:
+    """The innermost `frames` frames of the traceback of `exception`"""
+    summary = traceback.extract_tb(exception.__traceback__)[-frames:]
+    return [(os.path.basename(frame.filename), frame.name, frame.lineno or 0)
+            for frame in reversed(summary)]
+
+
+def sanitizer_frames(stderr: str, frames: int = 5) -> List[Frame]:
+    """The innermost `frames` frames of the first stack trace (the faulting
+    one) of a sanitizer report in `stderr`.  Run the program with e.g.
+    `ASAN_OPTIONS=abort_on_error=1` so that it dies by a signal."""
+    result: List[Frame] = []
+    for line in stderr.splitlines():
+        match = SANITIZER_FRAME.match(line)
+        if match is None:
+            if result:
+                break
+            continue
+        function, filename, lineno = match.groups()
+        result.append((os.path.basename(filename), function, int(lineno)))
+        if len(result) == frames:
+            break
+    return result
+
+
+def bucket_id(kind: str, frames: List[Frame]) -> str:
+    """A stable hash of the crash kind and its innermost frames"""
+    key = repr((kind, frames)).encode('utf-8')
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+
+class CrashBucket:
+    """All crashes with the same kind and innermost frames"""
+
+    def __init__(self, bucket: str, kind: str, frames: List[Frame],
+                 inp: str) -> None:
+        self.bucket = bucket
+        self.kind = kind
+        self.frames = frames
+        self.inp = inp  # smallest reproducer seen so far
+        self.count = 1
+
+    def to_json(self) -> Dict[str, Any]:
+        return {'bucket': self.bucket, 'kind': self.kind,
+                'frames': self.frames, 'count': self.count,
+                'length': len(self.inp)}
+
+    def __str__(self) -> str:
+        if self.frames:
+            file_name, function, lineno = self.frames[0]
+            location = "%s:%d in %s" % (file_name, lineno, function)
+        else:
+            location = "?"
+        return "%s %s at %s (%d crashes, reproducer %r)" % (
+            self.bucket, self.kind, location, self.count, self.inp)
+
+    __repr__ = __str__
+
+
+class CrashDatabase:
+    """Deduplicated crashes: one `CrashBucket` per stack hash.
+
+    With `path`, every bucket is stored in the directory `path` as
+    ```
+    <bucket>          the smallest reproducer
+    <bucket>.json     kind, frames and crash count
+    ```
+    Files are only written when a bucket is new or gets a smaller
+    reproducer, and on `sync()`; duplicates only count.
+    """
+
+    def __init__(self, path: Optional[str] = None, frames: int = 5) -> None:
+        """Constructor.
+        `path` - the directory to store buckets in (default: none).
+        `frames` - the number of innermost frames to hash.
+        """
+        self.path = path
+        self.frames = frames
+        self.buckets: Dict[str, CrashBucket] = {}
+        self._dirty: Set[str] = set()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def add(self, inp: str, kind: str, frames: List[Frame]) -> CrashBucket:
+        """Record a crash of `inp`.  Return its bucket."""
+        frames = [tuple(frame) for frame in frames[:self.frames]]
+        bucket = bucket_id(kind, frames)
+        crash = self.buckets.get(bucket)
+        if crash is None:
+            crash = self.buckets[bucket] = CrashBucket(bucket, kind, frames, inp)
+            self.save(crash)
+        else:
+            crash.count += 1
+            if len(inp) < len(crash.inp):
+                crash.inp = inp
+                self.save(crash)
+            else:
+                self._dirty.add(bucket)
+        return crash
+
+    def add_exception(self, inp: str, exception: BaseException) -> CrashBucket:
+        return self.add(inp, type(exception).__name__,
+                        exception_frames(exception, self.frames))
+
+    def add_signal(self, inp: str, signum: int, stderr: str = "") -> CrashBucket:
+        try:
+            kind = signal.Signals(signum).name
+        except ValueError:
+            kind = "signal %d" % signum
+        error = SANITIZER_ERROR.search(stderr)
+        if error is not None:
+            kind += " " + error.group(1)
+        return self.add(inp, kind, sanitizer_frames(stderr, self.frames))
+
+    def _write(self, file_name: str, data: bytes) -> None:
+        tmp_name = file_name + '.tmp'
+        with open(tmp_name, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_name, file_name)
+
+    def save(self, crash: CrashBucket) -> None:
+        self._dirty.discard(crash.bucket)
+        if self.path is None:
+            return
+        file_name = os.path.join(self.path, crash.bucket)
+        self._write(file_name, crash.inp.encode('utf-8', 'surrogatepass'))
+        self._write(file_name + '.json', json.dumps(crash.to_json()).encode())
+
+    def sync(self) -> None:
+        """Write the crash counts of all buckets"""
+        for bucket in list(self._dirty):
+            self.save(self.buckets[bucket])
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def __iter__(self):
+        return iter(self.buckets.values())
+
+
+class TriagingRunner(Runner):
+    """Wrap `runner`, recording every failing run in `crashes` and every
+    run that timed out in `hangs`.  Everything else (e.g. `coverage()`) is
+    delegated to `runner`."""
+
+    def __init__(self, runner: Runner,
+                 crashes: Optional[CrashDatabase] = None,
+                 hangs: Optional[CrashDatabase] = None) -> None:
+        self.runner = runner
+        self.crashes = crashes if crashes is not None else CrashDatabase()
+        self.hangs = hangs if hangs is not None else CrashDatabase()
+        self.crash: Optional[CrashBucket] = None  # bucket of the last run
+
+    def run(self, inp: str) -> Tuple[Any, str]:
+        result, outcome = self.runner.run(inp)
+        self.crash = None
+        if outcome == self.TIMEOUT:
+            # For functions, the frames where the time ran out
+            exception = getattr(self.runner, 'exception', None)
+            if exception is not None:
+                self.crash = self.hangs.add_exception(inp, exception)
+            else:
+                self.crash = self.hangs.add(inp, outcome, [])
+        elif outcome == self.FAIL:
+            exception = getattr(self.runner, 'exception', None)
+            # (kind, frames) of exceptions raised in another process
+            failure = getattr(self.runner, 'failure', None)
+            signum = getattr(self.runner, 'signal', None)
+            if exception is not None:
+                self.crash = self.crashes.add_exception(inp, exception)
+            elif failure is not None:
+                kind, frames = failure
+                self.crash = self.crashes.add(inp, kind, frames)
+            elif signum is not None:
+                stderr = getattr(result, 'stderr', None) or ""
+                if isinstance(stderr, bytes):
+                    stderr = stderr.decode('utf-8', 'replace')
+                self.crash = self.crashes.add_signal(inp, signum, stderr)
+            else:
+                self.crash = self.crashes.add(inp, outcome, [])
+        return (result, outcome)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.runner, name)
+
+
+if __name__ == '__main__':
+    from Mutation import FunctionCoverageRunner
+    from Greybox import GreyboxFuzzer, Mutator, PowerSchedule
+
+    def crashme(s: str) -> None:
+        if len(s) > 0 and s[0] == 'b':
+            if len(s) > 1 and s[1] == 'a':
+                raise ValueError("ba")
+        if '%' in s:
+            raise KeyError(s)
+
+    runner = TriagingRunner(FunctionCoverageRunner(crashme))
+    fuzzer = GreyboxFuzzer(["good"], Mutator(), PowerSchedule())
+    outcomes = [outcome for result, outcome in fuzzer.runs(runner, trials=5000)]
+    print("%d failing runs, %d buckets" %
+          (outcomes.count(Runner.FAIL), len(runner.crashes)))
+    for crash in runner.crashes:
+        print(crash)
@@ -1,10 +1,14 @@
-from typing import List,Union
+from typing import List,Union,Optional,Sequence
 import subprocess
 import random
+import math
+import signal
+import time
 class Runner:
     PASS = "PASS"
     FAIL = "FAIL"
     UNRESLOVED = "RESELOVED"
+    TIMEOUT = "TIMEOUT"
 
     def __init__(self) -> None:
         pass
@@ -13,9 +17,30 @@ class Runner:
         return (inp, Runner.UNRESLOVED)
 
 
+class ExecutionTimeout(BaseException):
+    """Raised in a function under test when it exceeds its time limit.
+    Derived from `BaseException`, so `except Exception` does not catch it."""
+
+
 class ProgramRunner(Runner):
-    def __init__(self, program: Union[str, List[str]]):
+    def __init__(self, program: Union[str, List[str]],
+                 timeout: Optional[float] = None,
+                 cpu_timeout: Optional[float] = None):
+        """Constructor.
+        `timeout` - wall clock seconds after which a run is killed.
+        `cpu_timeout` - CPU seconds after which a run is killed (whole
+        seconds, enforced through `RLIMIT_CPU`).
+        """
         self.program = program
+        self.timeout = timeout
+        self.cpu_timeout = cpu_timeout
+        self.signal: Optional[int] = None  # signal that killed the last run
+
+    def limit_cpu(self) -> None:
+        """Limit the CPU time of the current (child) process"""
+        import resource
+        seconds = math.ceil(self.cpu_timeout)
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds + 1))
 
     def run_process(self, inp: str = ""):
         return subprocess.run(self.program,
@@ -23,14 +48,23 @@ class ProgramRunner(Runner):
                               stdout=subprocess.PIPE,
                               stderr=subprocess.PIPE,
                               universal_newlines=True,
-                              shell=True
+                              shell=True,
+                              timeout=self.timeout,
+                              preexec_fn=self.limit_cpu if self.cpu_timeout else None
                               )
 
     def run(self, inp: str = ""):
-        result = self.run_process(inp)
+        try:
+            result = self.run_process(inp)
+        except subprocess.TimeoutExpired as exc:
+            self.signal = None
+            return (exc, self.TIMEOUT)
 
+        self.signal = -result.returncode if result.returncode < 0 else None
         if result.returncode == 0:
             outcome = self.PASS
+        elif self.signal == signal.SIGXCPU and self.cpu_timeout:
+            outcome = self.TIMEOUT
         elif result.returncode < 0:
             outcome = self.FAIL
         else:
@@ -45,7 +79,30 @@ class BinaryProgramRunner(ProgramRunner):
         return subprocess.run(self.program,
                               input=inp.encode(),
                               stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE)
+                              stderr=subprocess.PIPE,
+                              timeout=self.timeout,
+                              preexec_fn=self.limit_cpu if self.cpu_timeout else None)
+
+
+def calibrate_timeout(runner: Runner, inputs: Sequence[str],
+                      multiplier: float = 5.0, minimum: float = 0.01,
+                      maximum: Optional[float] = None) -> float:
+    """Set `runner.timeout` from the execution times of `inputs`, e.g. the
+    seeds, as AFL does: `multiplier` times their mean, but no less than the
+    slowest input or `minimum`, and no more than `maximum`.  Inputs are run
+    with `maximum` as timeout.  Return the new timeout."""
+    runner.timeout = maximum
+    times = []
+    for inp in inputs:
+        start = time.perf_counter()
+        runner.run(inp)
+        times.append(time.perf_counter() - start)
+    timeout = max(multiplier * sum(times) / max(len(times), 1),
+                  max(times, default=0), minimum)
+    if maximum is not None:
+        timeout = min(timeout, maximum)
+    runner.timeout = timeout
+    return timeout
 
 
 class Fuzzer:
@@ -2,14 +2,14 @@ import random
 from html.parser import HTMLParser
 import pickle
 import hashlib
-from typing import List, Set, Any, Tuple, Dict, Union
-from Coverage import Location
+from array import array
+from typing import List, Set, Any, Tuple, Dict, Union, Optional, Iterator, Deque
+from collections import Counter, deque
+from Coverage import Location, CumulativeCoverage
 from collections.abc import Sequence
-from Mutation import FunctionCoverageRunner, http_program, population_coverage
-from Fuzz import Fuzzer
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('TkAgg')
+from Mutation import FunctionCoverageRunner, CoverageNovelty, http_program, population_coverage
+from Fuzz import Fuzzer, Runner
+from InputLog import InputLog
 
 
 class Mutator:
@@ -51,11 +51,33 @@ class Mutator:
 
 class Seed:
     def __init__(self, data) -> None:
-        self.data = data
+        self.data = data  # also sets `mask` and `mask_branch`
         #Location = Tuple[str, int]
         self.coverage: Set[Location] = set()
         self.distance: Union[int, float] = -1
         self.energy = 0.0
+        self._path_id: Optional[int] = None
+        self.rare_branch: Any = None  # set by `RareBranchSchedule`
+        self.trimmed = False  # set by `trim_population()`
+        self.file: Optional[str] = None  # set by `CorpusDirectory`
+
+    @property
+    def data(self) -> str:
+        return self._data
+
+    @data.setter
+    def data(self, data: str) -> None:
+        """Set the input; a mutation mask computed for the old one is dropped"""
+        self._data = data
+        self.mask: Optional[bytes] = None  # mutation mask for `mask_branch`
+        self.mask_branch: Any = None
+
+    @property
+    def path_id(self) -> int:
+        """The path ID of `coverage`, computed once on first use"""
+        if self._path_id is None:
+            self._path_id = getPathID(self.coverage)
+        return self._path_id
 
     def __str__(self) -> str:
         return self.data
@@ -63,13 +85,66 @@ class Seed:
     __repr__ = __str__
 
 
+class EnergyTree:
+    """A sum tree over seed energies.  Updating the energy of one seed and
+    sampling a seed index weighted by energy both take O(log n)."""
+
+    def __init__(self) -> None:
+        self.capacity = 1
+        self.size = 0
+        self.tree = [0.0, 0.0]  # tree[1] is the root, leaves from `capacity`
+
+    def __len__(self) -> int:
+        return self.size
+
+    def total(self) -> float:
+        return self.tree[1]
+
+    def append(self, energy: float) -> None:
+        if self.size == self.capacity:
+            leaves = self.tree[self.capacity:] + [0.0] * self.capacity
+            self.capacity *= 2
+            self.tree = [0.0] * self.capacity + leaves
+            for i in range(self.capacity - 1, 0, -1):
+                self.tree[i] = self.tree[2 * i] + self.tree[2 * i + 1]
+        self.size += 1
+        self.update(self.size - 1, energy)
+
+    def update(self, index: int, energy: float) -> None:
+        i = index + self.capacity
+        self.tree[i] = energy
+        i //= 2
+        while i > 0:
+            self.tree[i] = self.tree[2 * i] + self.tree[2 * i + 1]
+            i //= 2
+
+    def sample(self) -> int:
+        """Return an index, chosen with probability energy/total"""
+        r = random.random() * self.tree[1]
+        i = 1
+        while i < self.capacity:
+            left = self.tree[2 * i]
+            if r < left:
+                i = 2 * i
+            else:
+                r -= left
+                i = 2 * i + 1
+        # Rounding may walk into the empty padding; fall back to the last seed
+        return min(i - self.capacity, self.size - 1)
+
+
 class PowerSchedule:
     def __init__(self) -> None:
         self.path_frequency: Dict = {}
+        self.invalidate()
+
+    def seedEnergy(self, seed: Seed) -> float:
+        """The energy of `seed`. To be overloaded in subclasses."""
+        return 1
 
     def assignEnergy(self, population: Sequence[Seed]) -> None:
         for seed in population:
-            seed.energy = 1
+            seed.energy = self.seedEnergy(seed)
 
     def normalizedEnergy(self, population: Sequence[Seed]) -> List[float]:
         energy = list(map(lambda seed: seed.energy, population))
@@ -78,66 +153,270 @@ class PowerSchedule:
         norm_energy = list(map(lambda nrg: nrg/sum_energy, energy))
         return norm_energy
 
+    def count_path(self, path_id: Any, count: int = 1) -> None:
+        """Record `count` more runs exercising `path_id`"""
+        self.path_frequency[path_id] = self.path_frequency.get(path_id, 0) + count
+        self._dirty_paths.add(path_id)
+
+    def invalidate(self) -> None:
+        """Recompute all energies on the next `choose()`.  To be called when
+           energies change other than through `count_path()`."""
+        self._tree = EnergyTree()
+        self._population: Optional[Sequence[Seed]] = None
+        self._members: Dict[Any, List[int]] = {}
+        self._dirty_paths: Set[Any] = set()
+
+    def update(self, population: Sequence[Seed]) -> None:
+        """Bring the energy tree up to date with `population`: add new seeds
+           and re-weight the seeds whose path frequency changed."""
+        if population is not self._population or len(population) < len(self._tree):
+            self.invalidate()
+            self._population = population
+
+        for index in range(len(self._tree), len(population)):
+            seed = population[index]
+            seed.energy = self.seedEnergy(seed)
+            self._tree.append(seed.energy)
+            self._members.setdefault(seed.path_id, []).append(index)
+
+        for path_id in self._dirty_paths:
+            for index in self._members.get(path_id, []):
+                seed = population[index]
+                seed.energy = self.seedEnergy(seed)
+                self._tree.update(index, seed.energy)
+        self._dirty_paths.clear()
+
     def choose(self, population: Sequence[Seed]) -> Seed:
         """Choose weighted by normalized energy."""
-        self.assignEnergy(population)
-        norm_energy = self.normalizedEnergy(population)
-        seed: Seed = random.choices(population, weights=norm_energy)[0]
-        return seed
+        if type(self).assignEnergy is not PowerSchedule.assignEnergy:
+            # Subclass assigns energies to the whole population at once
+            self.assignEnergy(population)
+            norm_energy = self.normalizedEnergy(population)
+            seed: Seed = random.choices(population, weights=norm_energy)[0]
+            return seed
+
+        self.update(population)
+        assert self._tree.total() != 0
+        return population[self._tree.sample()]
+
+
+# AFL's interesting values for the deterministic stages
+INTERESTING_8 = [-128, -1, 0, 1, 16, 32, 64, 100, 127]
+INTERESTING_16 = INTERESTING_8 + [-32768, -129, 128, 255, 256, 512, 1000, 1024,
+                                  4096, 32767]
+INTERESTING_32 = INTERESTING_16 + [-2147483648, -100663046, -32769, 32768,
+                                   65535, 65536, 100663045, 2147483647]
+ARITH_MAX = 35
+
+
+def deterministic_mutations(s: str, dictionary: Sequence[str] = ()) \
+        -> Iterator[Tuple[str, str]]:
+    """Walk all AFL-style deterministic mutations of `s`, yielding
+       (stage name, candidate) pairs: walking bit flips, byte flips,
+       8-bit arithmetic, interesting 8/16/32-bit values and dictionary
+       overwrites.  Strings beyond latin-1 yield nothing."""
+    try:
+        data = bytearray(s, 'latin-1')
+    except UnicodeEncodeError:
+        return
+    n = len(data)
+
+    for pos in range(n * 8):
+        data[pos >> 3] ^= 0x80 >> (pos & 7)
+        yield 'flip1', data.decode('latin-1')
+        data[pos >> 3] ^= 0x80 >> (pos & 7)
+
+    for pos in range(n):
+        data[pos] ^= 0xff
+        yield 'flip8', data.decode('latin-1')
+        data[pos] ^= 0xff
+
+    for pos in range(n):
+        orig = data[pos]
+        for delta in range(1, ARITH_MAX + 1):
+            for value in [(orig + delta) & 0xff, (orig - delta) & 0xff]:
+                if bin(orig ^ value).count('1') == 1:
+                    continue  # already done by flip1
+                data[pos] = value
+                yield 'arith8', data.decode('latin-1')
+        data[pos] = orig
+
+    for width, stage, values in [(1, 'interest8', INTERESTING_8),
+                                 (2, 'interest16', INTERESTING_16),
+                                 (4, 'interest32', INTERESTING_32)]:
+        for pos in range(n - width + 1):
+            orig = data[pos:pos + width]
+            for value in values:
+                new = (value & ((1 << (8 * width)) - 1)).to_bytes(width, 'little')
+                if new == orig:
+                    continue
+                data[pos:pos + width] = new
+                yield stage, data.decode('latin-1')
+            data[pos:pos + width] = orig
+
+    for keyword in dictionary:
+        for pos in range(n - len(keyword) + 1):
+            candidate = s[:pos] + keyword + s[pos + len(keyword):]
+            if candidate != s:
+                yield 'dict', candidate
 
 
 class AdvancedMutationFuzzer(Fuzzer):
-    def __init__(self, seeds: List[str], mutator: Mutator, schedule: PowerSchedule) -> None:
+    def __init__(self, seeds: List[str], mutator: Mutator, schedule: PowerSchedule,
+                 deterministic: bool = False,
+                 input_log: Optional[InputLog] = None) -> None:
+        """Constructor.
+        `deterministic` - walk `deterministic_mutations()` once for every
+        seed added to the population, before random (havoc) mutations.
+        `input_log` - record every input in this `InputLog` (bounded
+        memory) rather than in a list.
+        """
         super().__init__()
         self.seeds = seeds
         self.mutator = mutator
         self.schedule = schedule
-        self.inputs: List[str] = []
+        self.deterministic = deterministic
+        self.inputs: Union[List[str], InputLog] = \
+            input_log if input_log is not None else []
+        self.trials = 0
+        self.corpus: Any = None  # set by `CorpusDirectory.attach()`
+        # Per stage: number of inputs produced, and of those adding a seed
+        self.stage_execs: Counter = Counter()
+        self.stage_finds: Counter = Counter()
         self.reset()
 
     def reset(self) -> None:
-        self.population = list(map(lambda x: Seed(x), self.seeds))
+        self.population = []
+        self.pending_stages: Deque[Iterator[Tuple[str, str]]] = deque()
+        for seed in self.seeds:
+            self.add_seed(Seed(seed))
         self.seed_index = 0
+        self.candidates: List[str] = []
+        self.stage = 'seed'
+        self.cumulative = CumulativeCoverage()
+
+    def add_seed(self, seed: Seed) -> None:
+        """Add `seed` to the population"""
+        self.population.append(seed)
+        if self.corpus is not None:
+            self.corpus.add(seed)
+        if self.deterministic:
+            dictionary = getattr(self.mutator, 'dictionary', [])
+            self.pending_stages.append(deterministic_mutations(seed.data, dictionary))
+
+    def deterministic_candidate(self) -> Optional[str]:
+        """The next pending deterministic mutation, if any"""
+        while self.pending_stages:
+            mutation = next(self.pending_stages[0], None)
+            if mutation is not None:
+                self.stage, candidate = mutation
+                return candidate
+            self.pending_stages.popleft()
+        return None
 
     def create_candidate(self) -> str:
+        if self.candidates:
+            return self.candidates.pop()
         seed = self.schedule.choose(self.population)
+        return self.mutate_seed(seed)
+
+    def mutate_seed(self, seed: Seed) -> str:
+        """A new candidate from `seed`, by a random number of mutations"""
         candidate = seed.data
+
+        batch_size = getattr(self.mutator, 'batch_size', 1)
+        if batch_size > 1:
+            # One schedule choice, a batch of candidates from the same seed
+            trials = [min(len(candidate), 1 << random.randint(1, 5))
+                      for i in range(batch_size)]
+            self.candidates = self.mutator.mutate_batch(candidate, trials)
+            return self.candidates.pop()
+
         trials = min(len(candidate), 1 << random.randint(1, 5))
+        if hasattr(self.mutator, 'mutate_many'):
+            return self.mutator.mutate_many(candidate, trials)
         for i in range(trials):
             candidate = self.mutator.mutate(candidate)
         return candidate
 
+    def run(self, runner: Runner) -> Tuple[Any, str]:
+        result, outcome = super().run(runner)
+        if hasattr(runner, 'coverage'):
+            self.cumulative.add(runner.coverage())
+        return (result, outcome)
+
+    def population_coverage(self) -> Tuple[Set[Location], List[int]]:
+        """The same as `population_coverage(self.inputs, function)`, but
+           recorded during the runs, without executing any input again"""
+        return self.cumulative.population_coverage()
+
     def fuzz(self) -> str:
         if self.seed_index < len(self.seeds):
             self.inp = self.seeds[self.seed_index]
             self.seed_index += 1
+            self.stage = 'seed'
         else:
-            self.inp = self.create_candidate()
+            candidate = self.deterministic_candidate()
+            if candidate is None:
+                candidate = self.create_candidate()
+                self.stage = 'havoc'
+            self.inp = candidate
+        self.stage_execs[self.stage] += 1
+        self.trials += 1
         self.inputs.append(self.inp)
         return self.inp
 
 
-class GreyboxFuzzer(AdvancedMutationFuzzer):
+class GreyboxFuzzer(AdvancedMutationFuzzer, CoverageNovelty):
     def reset(self):
         super().reset()
-        self.coverages_seen = set()
+        self.reset_novelty()
         self.population = []
+        self.pending_stages.clear()
 
     def run(self, runner: FunctionCoverageRunner) -> Tuple[Any, str]:
         result, outcome = super().run(runner)
-        new_coverage = frozenset(runner.coverage())
-        if new_coverage not in self.coverages_seen:
-            seed = Seed(self.inp)
-            seed.coverage = runner.coverage()
-            self.coverages_seen.add(new_coverage)
-            self.population.append(seed)
+        # Coverage of runs cut short is incomplete; hangs are no seeds
+        if outcome != Runner.TIMEOUT and self.has_new_coverage(runner):
+            self.stage_finds[self.stage] += 1
+            self.add_seed(self.create_seed(runner))
+        if self.corpus is not None:
+            self.corpus.tick(self)
         return (result, outcome)
 
+    def create_seed(self, runner: FunctionCoverageRunner) -> Seed:
+        """The seed for the input just run by `runner`"""
+        seed = Seed(self.inp)
+        seed.coverage = runner.coverage()
+        return seed
+
+    def merge_seed(self, seed: Seed) -> bool:
+        """Add `seed`, found elsewhere, unless its coverage has been seen.
+           Return True if it was added."""
+        if not self.add_coverage(seed.coverage):
+            return False
+        self.add_seed(seed)
+        return True
+
+
+class _LocationHashes(dict):
+    """Stable 64-bit hashes of locations, computed once per location"""
+
+    def __missing__(self, location: Location) -> int:
+        digest = hashlib.blake2b(pickle.dumps(location), digest_size=8).digest()
+        value = self[location] = int.from_bytes(digest, 'little')
+        return value
+
+
+_location_hashes = _LocationHashes()
+
 
 def getPathID(coverage):
-    """Returns a unique hash for the covered statements"""
-    pickled = pickle.dumps(sorted(coverage))
-    return hashlib.md5(pickled).hexdigest()
+    """Returns a unique hash for the covered statements.
+    The hash is the sum of per-location hashes modulo 2**64: it does not
+    depend on order (no sorting), costs one dict lookup per location, and
+    is the same in every process (unlike `hash()`)."""
+    return sum(map(_location_hashes.__getitem__, coverage)) & 0xffffffffffffffff
 
 
 class AFLFastSchedule(PowerSchedule):
@@ -145,24 +424,223 @@ class AFLFastSchedule(PowerSchedule):
         super().__init__()
         self.exponent = exponent
 
-    def assignEnergy(self, population: Sequence[Seed]) -> None:
-        for seed in population:
-            seed.energy = 1/(self.path_frequency[getPathID(seed.coverage)]
-                             ** self.exponent)
+    def seedEnergy(self, seed: Seed) -> float:
+        return 1/(self.path_frequency[seed.path_id] ** self.exponent)
+
+
+class DirectedSchedule(PowerSchedule):
+    """Assign more energy to seeds closer to a target.  `distance` maps
+       locations to their distance to the target, as returned by
+       `Callgraph.get_distances()`."""
+
+    def __init__(self, distance: Dict[Location, float], exponent: float) -> None:
+        super().__init__()
+        self.distance = distance
+        self.exponent = exponent
+        self.unreachable = max(distance.values(), default=0) + 1
+
+    def seedDistance(self, seed: Seed) -> float:
+        """The mean distance of the locations covered by `seed`, computed
+           once and kept in `seed.distance`"""
+        if seed.distance < 0:
+            distances = [self.distance[location] for location in seed.coverage
+                         if location in self.distance]
+            if distances:
+                seed.distance = sum(distances) / len(distances)
+            else:
+                seed.distance = self.unreachable
+        return seed.distance
+
+    def seedEnergy(self, seed: Seed) -> float:
+        return (1 / (self.seedDistance(seed) + 1)) ** self.exponent
+
+
+class AnnealingSchedule(DirectedSchedule):
+    """Simulated annealing as in AFLGo: start with uniform energy
+       (exploration), then raise the exponent until closer seeds dominate
+       (exploitation).  After `time_to_exploit` choices, the temperature
+       has dropped to 5%; energies are recomputed every `anneal_every`
+       choices."""
+
+    def __init__(self, distance: Dict[Location, float], exponent: float = 50,
+                 time_to_exploit: int = 1000, anneal_every: int = 100) -> None:
+        super().__init__(distance, exponent)
+        self.time_to_exploit = time_to_exploit
+        self.anneal_every = anneal_every
+        self.choices = 0
+
+    def temperature(self) -> float:
+        return 20 ** (-self.choices / self.time_to_exploit)
+
+    def seedEnergy(self, seed: Seed) -> float:
+        exponent = self.exponent * (1 - self.temperature())
+        return (1 / (self.seedDistance(seed) + 1)) ** exponent
+
+    def choose(self, population: Sequence[Seed]) -> Seed:
+        if self.choices % self.anneal_every == 0:
+            self.invalidate()
+        self.choices += 1
+        return super().choose(population)
+
+
+class RareBranchSchedule(PowerSchedule):
+    """FairFuzz: prefer seeds hitting rare branches.  `hit_count` counts,
+       for every branch (an element of the runners' coverage, e.g. an edge
+       of `EdgeCoverage`), the number of inputs that hit it.  A branch is
+       rare if hit at most `rarity_cutoff()` times.  A seed targets the
+       rarest branch it hits (`seed.rare_branch`, None if not rare) and gets
+       energy 1/hits of it; seeds without a rare branch get `common_weight`
+       times that.  Energies and the cutoff are recomputed every
+       `update_every` choices."""
+
+    def __init__(self, common_weight: float = 0.01,
+                 update_every: int = 100) -> None:
+        super().__init__()
+        self.hit_count: Counter = Counter()
+        self.common_weight = common_weight
+        self.update_every = update_every
+        self.choices = 0
+        self.cutoff = 1
+
+    def count_branches(self, coverage: Any) -> None:
+        """Record one more input hitting the branches in `coverage`"""
+        self.hit_count.update(coverage)
+
+    def rarity_cutoff(self) -> int:
+        """The smallest power of two not less than the fewest hits of any
+           branch"""
+        fewest = min(self.hit_count.values(), default=1)
+        return 1 << (fewest - 1).bit_length()
+
+    def seedEnergy(self, seed: Seed) -> float:
+        if not seed.coverage:
+            seed.rare_branch = None
+            return self.common_weight
+        branch = min(seed.coverage, key=self.hit_count.__getitem__)
+        hits = max(self.hit_count[branch], 1)
+        if hits > self.cutoff:
+            seed.rare_branch = None
+            return self.common_weight / hits
+        # Keep the target the seed has a mask for while it is still rare
+        if (seed.mask_branch is not None and
+                self.hit_count[seed.mask_branch] <= self.cutoff):
+            branch = seed.mask_branch
+        seed.rare_branch = branch
+        return 1 / hits
+
+    def choose(self, population: Sequence[Seed]) -> Seed:
+        if self.choices % self.update_every == 0:
+            self.cutoff = self.rarity_cutoff()
+            self.invalidate()
+        self.choices += 1
+        return super().choose(population)
 
 
 class CountingGreyboxFuzzer(GreyboxFuzzer):
     def reset(self):
         super().reset()
         self.schedule.path_frequency = {}
+        self.schedule.invalidate()
+
+    def last_path_id(self, runner: FunctionCoverageRunner) -> int:
+        """The path ID of the last run, computed once per run"""
+        if self._last_path_id is None:
+            self._last_path_id = getPathID(runner.coverage())
+        return self._last_path_id
+
+    def create_seed(self, runner: FunctionCoverageRunner) -> Seed:
+        seed = super().create_seed(runner)
+        seed._path_id = self.last_path_id(runner)
+        return seed
 
     def run(self, runner: FunctionCoverageRunner) -> Tuple[Any, str]:
+        self._last_path_id: Optional[int] = None
         result, outcome = super().run(runner)
-        path_id = getPathID(runner.coverage())
-        if path_id not in self.schedule.path_frequency:
-            self.schedule.path_frequency[path_id] = 1
-        else:
-            self.schedule.path_frequency[path_id] += 1
+        self.schedule.count_path(self.last_path_id(runner))
+        return (result, outcome)
+
+
+# Mutations a position of a mutation mask allows
+MASK_OVERWRITE = 1
+MASK_DELETE = 2
+MASK_INSERT = 4
+MASK_ALL = MASK_OVERWRITE | MASK_DELETE | MASK_INSERT
+
+
+def mask_candidates(s: str) -> Iterator[Tuple[int, int, str]]:
+    """The inputs to run for the mutation mask of `s` (FairFuzz): for every
+       position, `s` with the character overwritten, deleted, and with a
+       character inserted before it, as (position, mask bit, candidate).
+       Position `len(s)` is for appending."""
+    for pos in range(len(s) + 1):
+        if pos < len(s):
+            yield pos, MASK_OVERWRITE, s[:pos] + chr(ord(s[pos]) ^ 0xff) + s[pos + 1:]
+            yield pos, MASK_DELETE, s[:pos] + s[pos + 1:]
+        yield pos, MASK_INSERT, s[:pos] + chr(random.randrange(32, 127)) + s[pos:]
+
+
+class FairGreyboxFuzzer(GreyboxFuzzer):
+    """FairFuzz: with a `RareBranchSchedule`, fuzz seeds hitting rare
+       branches, and with a `MaskedMutator`, only mutate them where the
+       rare branch stays covered.  The mask of a seed is computed once per
+       target branch, in a stage 'mask' of regular trials that runs the
+       `mask_candidates()`; until it is done, the seed is mutated freely.
+       New mask stages start only while they took less than `mask_share`
+       of all trials."""
+
+    def __init__(self, seeds: List[str], mutator: Mutator,
+                 schedule: Optional[RareBranchSchedule] = None,
+                 mask_share: float = 0.25, **kwargs: Any) -> None:
+        """Constructor.
+        `schedule` - a `RareBranchSchedule` (default: a new one).
+        `mask_share` - the share of trials mask stages may take.
+        """
+        if schedule is None:
+            schedule = RareBranchSchedule()
+        elif not isinstance(schedule, RareBranchSchedule):
+            raise TypeError("FairGreyboxFuzzer needs a RareBranchSchedule, not %s"
+                            % type(schedule).__name__)
+        self.mask_share = mask_share
+        super().__init__(seeds, mutator, schedule, **kwargs)
+
+    def reset(self):
+        super().reset()
+        self.schedule.hit_count.clear()
+        self.schedule.invalidate()
+        self.runner: Optional[Runner] = None
+
+    def mask_stage(self, seed: Seed, branch: Any) -> Iterator[Tuple[str, str]]:
+        """The mutation mask of `seed` for `branch`: for every position, the
+           mutations that keep `branch` covered.  Takes 3 * len(data) + 1
+           trials; the mask is dropped if `seed.data` changed meanwhile."""
+        data = seed.data
+        mask = bytearray(len(data) + 1)
+        for pos, bit, candidate in mask_candidates(data):
+            yield 'mask', candidate
+            # Resumed after `candidate` ran
+            if branch in self.runner.coverage():
+                mask[pos] |= bit
+        if seed.data == data and seed.mask_branch == branch:
+            seed.mask = bytes(mask)
+
+    def mutate_seed(self, seed: Seed) -> str:
+        branch = seed.rare_branch
+        if branch is None or not hasattr(self.mutator, 'mutate_masked'):
+            return super().mutate_seed(seed)
+        if (seed.mask_branch != branch and
+                self.stage_execs['mask'] <= self.mask_share * self.trials):
+            seed.mask = None
+            seed.mask_branch = branch
+            self.pending_stages.appendleft(self.mask_stage(seed, branch))
+        if seed.mask_branch != branch:
+            return super().mutate_seed(seed)
+        trials = min(len(seed.data), 1 << random.randint(1, 5))
+        return self.mutator.mutate_masked(seed.data, seed.mask, trials)
+
+    def run(self, runner: FunctionCoverageRunner) -> Tuple[Any, str]:
+        self.runner = runner
+        result, outcome = super().run(runner)
+        self.schedule.count_branches(runner.coverage())
         return (result, outcome)
 
 
@@ -196,8 +674,114 @@ class MazeMutator(DictMutator):
         if len(s) > 0:
             return s[:-1]
         return s
+
+
+class ByteMutator(Mutator):
+    """Variant of `Mutator` that stacks mutations in place on a `bytearray`.
+    `mutate_many()` applies several mutations with a single copy of the
+    input; `mutate_batch()` creates a batch of candidates from one input,
+    drawing the random numbers for the whole batch in one call.
+    With `batch_size > 1`, `AdvancedMutationFuzzer` creates candidates in
+    batches of that size."""
+
+    def __init__(self, batch_size: int = 1) -> None:
+        super().__init__()
+        self.batch_size = batch_size
+        self.byte_mutators = [
+            self.delete_random_byte,
+            self.insert_random_byte,
+            self.flip_random_byte
+        ]
+
+    # Each byte mutator takes the buffer and two random 32-bit numbers
+    def insert_random_byte(self, buf: bytearray, r1: int, r2: int) -> None:
+        buf.insert(r1 % (len(buf) + 1), 32 + r2 % 95)
+
+    def delete_random_byte(self, buf: bytearray, r1: int, r2: int) -> None:
+        if not buf:
+            return self.insert_random_byte(buf, r1, r2)
+        del buf[r1 % len(buf)]
+
+    def flip_random_byte(self, buf: bytearray, r1: int, r2: int) -> None:
+        if not buf:
+            return self.insert_random_byte(buf, r1, r2)
+        buf[r1 % len(buf)] ^= 1 << (r2 % 7)
+
+    def _random_words(self, n: int) -> array:
+        words = array('I')
+        words.frombytes(random.getrandbits(32 * n).to_bytes(4 * n, 'little')
+                        if n else b'')
+        return words
+
+    def mutate_many(self, s: str, trials: int) -> str:
+        """Return `s` with `trials` random mutations applied"""
+        return self.mutate_batch(s, [trials])[0]
+
+    def mutate_batch(self, s: str, trials: Sequence[int]) -> List[str]:
+        """Return one candidate per element of `trials`, each created from `s`
+           by applying that many random mutations"""
+        try:
+            base = bytearray(s, 'latin-1')
+        except UnicodeEncodeError:
+            # Characters beyond latin-1: fall back to string mutations
+            candidates = []
+            for n in trials:
+                candidate = s
+                for i in range(n):
+                    candidate = self.mutate(candidate)
+                candidates.append(candidate)
+            return candidates
+
+        total = sum(trials)
+        operations = random.choices(self.byte_mutators, k=total)
+        words = self._random_words(2 * total)
+        candidates = []
+        k = 0
+        for n in trials:
+            buf = base[:]
+            for i in range(k, k + n):
+                operations[i](buf, words[2 * i], words[2 * i + 1])
+            k += n
+            candidates.append(buf.decode('latin-1'))
+        return candidates
+
+
+class MaskedMutator(Mutator):
+    """Variant of `Mutator` that can restrict mutations to the positions a
+    mutation mask allows (see `FairGreyboxFuzzer.mask_stage()`).  Characters
+    it inserts may be mutated further."""
+
+    def mutate_masked(self, s: str, mask: Optional[bytes], trials: int) -> str:
+        """Return `s` with up to `trials` random mutations allowed by `mask`"""
+        if not mask or not any(mask):
+            candidate = s
+            for i in range(trials):
+                candidate = self.mutate(candidate)
+            return candidate
+
+        chars = list(s)
+        allowed = list(mask)
+        for i in range(trials):
+            operation = random.choice([MASK_OVERWRITE, MASK_DELETE, MASK_INSERT])
+            end = len(chars) + 1 if operation == MASK_INSERT else len(chars)
+            positions = [pos for pos in range(end) if allowed[pos] & operation]
+            if not positions:
+                continue
+            pos = random.choice(positions)
+            if operation == MASK_OVERWRITE:
+                chars[pos] = chr(ord(chars[pos]) ^ (1 << random.randint(0, 6)))
+            elif operation == MASK_DELETE:
+                del chars[pos]
+                del allowed[pos]
+            else:
+                chars.insert(pos, chr(random.randrange(32, 127)))
+                allowed.insert(pos, MASK_ALL)
+        return ''.join(chars)
     
 if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
 
     def crashme(s: str) -> None:
         if len(s) > 0 and s[0] == 'b':
@@ -0,0 +1,123 @@
+import os
+import gzip
+import json
+from collections import deque
+from typing import Iterator, Iterable, Optional, Deque, Any, IO
+
+
+class PartialLogError(ValueError):
+    """Raised when replaying an `InputLog` that did not retain every input"""
+
+
+class InputLog:
+    """A bounded-memory replacement for the `inputs` list of a fuzzer.
+
+    The last `keep` inputs are held in memory.  If `path` is given, every
+    `sample_every`-th input is also appended to gzip-compressed segment
+    files `path.000000.gz`, `path.000001.gz`, ...; a new segment is started
+    every `segment_size` logged inputs, and only the newest `max_segments`
+    segments are kept.  Memory use is thus constant, and so is disk use
+    when `max_segments` is set.  Use as
+    ```
+    fuzzer = GreyboxFuzzer(seeds, Mutator(), PowerSchedule(),
+                           input_log=InputLog("inputs.log", keep=1000))
+    fuzzer.runs(runner, trials=1000000)
+    population_coverage(fuzzer.inputs, function)  # replays the logged inputs
+    ```
+    Iterating over a log that did not retain every input (see `skipped()`)
+    raises `PartialLogError`, so that coverage over time is not silently
+    computed from a part of the inputs; `retained()` iterates anyway.
+    """
+
+    def __init__(self, path: Optional[str] = None, keep: int = 1000,
+                 sample_every: int = 1, segment_size: int = 100000,
+                 max_segments: Optional[int] = None) -> None:
+        assert max_segments is None or max_segments >= 1
+        self.path = path
+        self.recent: Deque[str] = deque(maxlen=keep)
+        self.sample_every = sample_every
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.count = 0
+        self.logged = 0   # inputs written to segments
+        self.dropped = 0  # of these, the ones in removed segments
+        self.segments: Deque[str] = deque()
+        self.segment_counts: Deque[int] = deque()  # inputs in each segment
+        self._segment: Optional[IO[str]] = None
+        self._next_segment = 0
+
+    def __len__(self) -> int:
+        """The number of inputs appended (not only those retained)"""
+        return self.count
+
+    def append(self, inp: str) -> None:
+        self.recent.append(inp)
+        if self.path is not None and self.count % self.sample_every == 0:
+            self._log(inp)
+        self.count += 1
+
+    def extend(self, inputs: Iterable[str]) -> None:
+        for inp in inputs:
+            self.append(inp)
+
+    def _log(self, inp: str) -> None:
+        if self._segment is None or self.segment_counts[-1] >= self.segment_size:
+            self._rotate()
+        assert self._segment is not None
+        self._segment.write(json.dumps(inp) + '\n')
+        self.segment_counts[-1] += 1
+        self.logged += 1
+
+    def _rotate(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+        name = '%s.%06d.gz' % (self.path, self._next_segment)
+        self._next_segment += 1
+        self._segment = gzip.open(name, 'wt', encoding='utf-8', compresslevel=1)
+        self.segments.append(name)
+        self.segment_counts.append(0)
+        while self.max_segments is not None and len(self.segments) > self.max_segments:
+            os.remove(self.segments.popleft())
+            # Segments finished by `flush()` may hold fewer than `segment_size`
+            self.dropped += self.segment_counts.popleft()
+
+    def flush(self) -> None:
+        """Finish the current segment, so all logged inputs can be read"""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def skipped(self) -> int:
+        """The number of inputs appended, but not retained for replay"""
+        if self.path is None:
+            return self.count - len(self.recent)
+        return self.count - (self.logged - self.dropped)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over all inputs appended, oldest first.  Raise
+           `PartialLogError` if some were not retained."""
+        skipped = self.skipped()
+        if skipped:
+            raise PartialLogError("%d of %d inputs were not retained; "
+                                  "use retained() to replay the others"
+                                  % (skipped, self.count))
+        return self.retained()
+
+    def retained(self) -> Iterator[str]:
+        """Iterate over the retained inputs, oldest first: the logged ones
+           if there is a log, and the ones held in memory otherwise."""
+        if self.path is None:
+            yield from list(self.recent)
+            return
+        self.flush()
+        for name in list(self.segments):
+            with gzip.open(name, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def __getitem__(self, key: Any) -> Any:
+        """Index or slice the inputs held in memory, e.g. `inputs[-10:]`"""
+        return list(self.recent)[key]
+
+    def close(self) -> None:
+        self.flush()
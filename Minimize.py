@@ -0,0 +1,144 @@
+import heapq
+from typing import List, Any, Optional, Tuple, FrozenSet
+from collections.abc import Sequence
+from Greybox import GreyboxFuzzer, Seed
+from Corpus import CorpusDirectory
+from Fuzz import Runner
+
+
+def minimize_corpus(population: Sequence[Seed]) -> List[Seed]:
+    """The seeds of `population` needed to keep its total coverage (cmin).
+    A greedy set cover: repeatedly pick the seed covering the most locations
+    not covered yet, the shortest one on ties.  The result keeps the order
+    of `population`."""
+    uncovered = set()
+    for seed in population:
+        uncovered |= seed.coverage
+
+    # Lazy greedy: a seed's gain can only shrink, so it is recomputed only
+    # when the seed comes out on top of the heap
+    heap = [(-len(seed.coverage), len(seed.data), index)
+            for index, seed in enumerate(population)]
+    heapq.heapify(heap)
+    chosen = []
+    while uncovered and heap:
+        gain, length, index = heapq.heappop(heap)
+        new = len(uncovered.intersection(population[index].coverage))
+        if new == 0:
+            continue
+        if heap and (-new, length, index) > heap[0]:
+            heapq.heappush(heap, (-new, length, index))
+            continue
+        chosen.append(index)
+        uncovered.difference_update(population[index].coverage)
+    return [population[index] for index in sorted(chosen)]
+
+
+def _signature(runner: Runner, inp: str) -> Tuple[str, FrozenSet[Any]]:
+    result, outcome = runner.run(inp)
+    return (outcome, frozenset(runner.coverage()))
+
+
+def trim_input(inp: str, runner: Runner) -> str:
+    """Shrink `inp` as long as running it gives the same outcome and exactly
+    the same coverage (tmin).  Removes blocks of decreasing power-of-two
+    sizes, down to single characters."""
+    signature = _signature(runner, inp)
+    block = 1 << (len(inp).bit_length() - 1) if inp else 0
+    while block >= 1:
+        pos = 0
+        while pos < len(inp):
+            candidate = inp[:pos] + inp[pos + block:]
+            if _signature(runner, candidate) == signature:
+                inp = candidate
+            else:
+                pos += block
+        block >>= 1
+    return inp
+
+
+def trim_population(population: Sequence[Seed], runner: Runner,
+                    corpus: Optional[CorpusDirectory] = None) -> int:
+    """Trim the data of the seeds not trimmed before, in place.  Coverage
+    (and thus path IDs and energies) stays the same.  Seeds that shrank are
+    saved to `corpus`, if given.  Return the number of characters removed."""
+    removed = 0
+    for seed in population:
+        if seed.trimmed:
+            continue
+        trimmed = trim_input(seed.data, runner)
+        if len(trimmed) < len(seed.data):
+            removed += len(seed.data) - len(trimmed)
+            seed.data = trimmed
+            if corpus is not None:
+                corpus.update(seed)
+        seed.trimmed = True
+    return removed
+
+
+def minimize_population(fuzzer: GreyboxFuzzer,
+                        runner: Optional[Runner] = None) -> None:
+    """Replace `fuzzer.population` by its minimized corpus, trimming the
+    remaining new seeds if `runner` is given.  The fuzzer's corpus directory
+    gets the trimmed seeds and drops the others.  The schedule sees a new
+    population object and recomputes all energies on its next choice."""
+    population = minimize_corpus(fuzzer.population)
+    if fuzzer.corpus is not None:
+        kept = set(map(id, population))
+        for seed in fuzzer.population:
+            if id(seed) not in kept:
+                fuzzer.corpus.remove(seed)
+    if runner is not None:
+        trim_population(population, runner, fuzzer.corpus)
+    fuzzer.population = population
+
+
+class MinimizingFuzzer:
+    """Run a `GreyboxFuzzer` campaign, minimizing the population every
+    `minimize_every` trials.  Use as
+    ```
+    fuzzer = CountingGreyboxFuzzer([seed], Mutator(), AFLFastSchedule(5))
+    MinimizingFuzzer(fuzzer, minimize_every=1000).runs(runner, trials=10000)
+    ```
+    """
+
+    def __init__(self, fuzzer: GreyboxFuzzer, minimize_every: int = 1000,
+                 trim: bool = True) -> None:
+        """Constructor.
+        `fuzzer` - the fuzzer whose population is minimized.
+        `minimize_every` - the number of trials between minimizations.
+        `trim` - whether to also trim the seeds that are kept.
+        """
+        self.fuzzer = fuzzer
+        self.minimize_every = minimize_every
+        self.trim = trim
+
+    def runs(self, runner: Runner, trials: int = 10) -> List[Tuple[Any, str]]:
+        results: List[Tuple[Any, str]] = []
+        while len(results) < trials:
+            n = min(self.minimize_every, trials - len(results))
+            results += self.fuzzer.runs(runner, trials=n)
+            minimize_population(self.fuzzer, runner if self.trim else None)
+        return results
+
+
+if __name__ == '__main__':
+    from Mutation import FunctionCoverageRunner, http_program
+    from Greybox import Mutator, PowerSchedule
+
+    seed_input = "http://www.google.com/search?q=fuzzing"
+    runner = FunctionCoverageRunner(http_program)
+    fuzzer = GreyboxFuzzer([seed_input], Mutator(), PowerSchedule())
+    fuzzer.runs(runner, trials=3000)
+
+    population = fuzzer.population
+    minimized = minimize_corpus(population)
+    covered = set().union(*(seed.coverage for seed in population))
+    assert covered == set().union(*(seed.coverage for seed in minimized))
+    print("%d seeds, %d characters" %
+          (len(population), sum(len(seed.data) for seed in population)))
+    print("cmin: %d seeds, %d characters" %
+          (len(minimized), sum(len(seed.data) for seed in minimized)))
+    trim_population(minimized, runner)
+    print("tmin: %d seeds, %d characters" %
+          (len(minimized), sum(len(seed.data) for seed in minimized)))
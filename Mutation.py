@@ -1,11 +1,9 @@
-from typing import Tuple, List, Callable, Set, Any
+from typing import Tuple, List, Callable, Set, Any, Type, Optional, Sequence
 from urllib.parse import urlparse
-from Fuzz import Fuzzer,Runner
-from Coverage import Coverage,population_coverage,Location
+from Fuzz import Fuzzer,Runner,ExecutionTimeout
+from Coverage import Coverage,population_coverage,Location,EdgeBitmap,VirginBits,CumulativeCoverage
 import random
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('TkAgg')
+import signal
 
 class MutationFuzzer(Fuzzer):
     """Base class for mutational fuzzing"""
@@ -30,37 +28,106 @@ class MutationFuzzer(Fuzzer):
         self.seed_index = 0
 
 class FunctionRunner(Runner):
-    def __init__(self,function:Callable) -> None:
+    def __init__(self,function:Callable,
+                 timeout: Optional[float] = None,
+                 cpu_timeout: Optional[float] = None) -> None:
+        """`timeout` and `cpu_timeout` limit the wall clock and CPU seconds
+           of a run.  They are enforced by signals, so runs must happen in
+           the main thread."""
         self.function = function
+        self.timeout = timeout
+        self.cpu_timeout = cpu_timeout
+        self.exception: Optional[BaseException] = None  # raised by the last run
     
     def run_function(self,inp:str):
         return self.function(inp)
+
+    def _expire(self, signum: int, frame: Any) -> None:
+        raise ExecutionTimeout()
+
+    def _set_timers(self, timeout: Optional[float],
+                    cpu_timeout: Optional[float]) -> List[Tuple[int, Any]]:
+        """Start the timers; return the (signal, previous handler) pairs"""
+        handlers = []
+        if timeout:
+            handlers.append((signal.SIGALRM,
+                             signal.signal(signal.SIGALRM, self._expire)))
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        if cpu_timeout:
+            handlers.append((signal.SIGVTALRM,
+                             signal.signal(signal.SIGVTALRM, self._expire)))
+            signal.setitimer(signal.ITIMER_VIRTUAL, cpu_timeout)
+        return handlers
     
     def run(self,inp:str):
+        self.exception = None
+        timeout, cpu_timeout = self.timeout, self.cpu_timeout
+        # Outside the main thread, this raises ValueError: not a crash
+        handlers = self._set_timers(timeout, cpu_timeout)
         try:
-            result = self.run_function(inp)
+            try:
+                result = self.run_function(inp)
+            finally:
+                if timeout:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                if cpu_timeout:
+                    signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+                for signum, handler in handlers:
+                    signal.signal(signum, handler)
             outcome = self.PASS
-        except Exception:
+        except ExecutionTimeout as exc:
+            # Drop the frame of `_expire()`; keep the one where time ran out
+            tb = exc.__traceback__
+            while tb.tb_next is not None and tb.tb_next.tb_next is not None:
+                tb = tb.tb_next
+            tb.tb_next = None
+            result = None
+            outcome = self.TIMEOUT
+            self.exception = exc
+        except Exception as exc:
             result = None
             outcome = self.FAIL
+            self.exception = exc
         return result,outcome
     
 
 class FunctionCoverageRunner(FunctionRunner):
+    def __init__(self, function: Callable,
+                 coverage_class: Type[Coverage] = Coverage,
+                 timeout: Optional[float] = None,
+                 cpu_timeout: Optional[float] = None,
+                 include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        """`coverage_class` selects the coverage backend, e.g. `FastCoverage`.
+        `include`/`exclude` restrict tracing to modules or files (see `Scope`)."""
+        super().__init__(function, timeout, cpu_timeout)
+        self.coverage_class = coverage_class
+        self.include = include
+        self.exclude = exclude
+
     def run_function(self, inp: str) -> Any:
-        with Coverage() as cov:
+        exception = None
+        with self.coverage_class(include=self.include, exclude=self.exclude) as cov:
             try:
-                result = super().run_function(inp)
-            except Exception as exc:
-                self._coverage = cov.coverage()
-                raise exc
+                # Call the function directly, so as not to trace ourselves
+                result = self.function(inp)
+            except BaseException as exc:  # including `ExecutionTimeout`
+                exception = exc
 
+        # Only now that tracing is off
         self._coverage = cov.coverage()
+        self._bitmap = getattr(cov, 'bitmap', None)
+        if exception is not None:
+            raise exception
         return result
 
     def coverage(self) -> Set[Location]:
         return self._coverage
 
+    def bitmap(self) -> Optional[EdgeBitmap]:
+        """The edge bitmap of the last run, if the coverage backend has one"""
+        return self._bitmap
+
 
 def delete_random_character(s: str) -> str:
         """Returns s with a random character deleted"""
@@ -138,12 +205,46 @@ class MutationFuzzer(MutationFuzzer):
             self.inp = self.create_candidate()
         return self.inp
 
-class MutationCoverageFuzzer(MutationFuzzer):
+class CoverageNovelty:
+    """The novelty check of the coverage-guided fuzzers.  `coverages_seen`
+    holds the coverage sets seen so far; with an edge bitmap, `virgin_bits`
+    decides instead, and `coverages_seen` holds the coverage of the runs
+    found new, so that it can still reject duplicate seeds."""
+
+    def reset_novelty(self) -> None:
+        self.coverages_seen: Set[frozenset] = set()
+        self.virgin_bits: Optional[VirginBits] = None
+
+    def add_coverage(self, coverage: Any) -> bool:
+        """Record `coverage`; return whether it had not been seen"""
+        coverage = frozenset(coverage)
+        if coverage in self.coverages_seen:
+            return False
+        self.coverages_seen.add(coverage)
+        return True
+
+    def has_new_coverage(self, runner: FunctionCoverageRunner) -> bool:
+        """Whether the last run reached new coverage.  Uses the runner's
+           edge bitmap if it has one, and the set of covered lines if not."""
+        bitmap = runner.bitmap() if hasattr(runner, 'bitmap') else None
+        if bitmap is None:
+            return self.add_coverage(runner.coverage())
+
+        if self.virgin_bits is None:
+            self.virgin_bits = VirginBits(bitmap.size)
+        if self.virgin_bits.has_new_bits(bitmap) == 0:
+            return False
+        self.add_coverage(runner.coverage())
+        return True
+
+
+class MutationCoverageFuzzer(MutationFuzzer, CoverageNovelty):
     """Fuzz with mutated inputs based on coverage"""
 
     def reset(self) -> None:
         super().reset()
-        self.coverages_seen: Set[frozenset] = set()
+        self.reset_novelty()
+        self.cumulative = CumulativeCoverage()
         # Now empty; we fill this with seed in the first fuzz runs
         self.population = []
 
@@ -153,15 +254,22 @@ class MutationCoverageFuzzer(MutationFuzzer):
            add inp to population and its coverage to population_coverage
         """
         result, outcome = super().run(runner)
-        new_coverage = frozenset(runner.coverage())
-        if outcome == Runner.PASS and new_coverage not in self.coverages_seen:
+        self.cumulative.add(runner.coverage())
+        if outcome == Runner.PASS and self.has_new_coverage(runner):
             # We have new coverage
             self.population.append(self.inp)
-            self.coverages_seen.add(new_coverage)
 
         return result
 
+    def population_coverage(self) -> Tuple[Set[Location], List[int]]:
+        """The same as `population_coverage()` over all inputs run so far,
+           but recorded during the runs, without executing them again"""
+        return self.cumulative.population_coverage()
+
 if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
 
     '''
     http_runner = FunctionCoverageRunner(http_program)
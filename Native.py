@@ -0,0 +1,411 @@
+import os
+import math
+import mmap
+import select
+import signal
+import struct
+import tempfile
+import subprocess
+from typing import List, Dict, Union, Optional, Sequence, Set
+from Fuzz import ProgramRunner
+from Coverage import Location, EdgeBitmap, MAP_SIZE
+
+# The most distinct basic blocks recorded per run
+MAX_PCS = 1 << 16
+
+# Compiled without instrumentation and linked into the program under test.
+# Every instrumented basic block calls `__sanitizer_cov_trace_pc()`, which
+# counts the transition from the previous block in an AFL-style edge map
+# and appends the block's address (relative to the executable) to a list
+# the first time it is hit.  Both live in a file shared with the fuzzer.
+#
+# If started with the fork server variable set to "<control fd>,<status fd>",
+# the program becomes an AFL-style fork server before `main()` runs: it
+# reports 4 bytes on the status pipe, then for every 4 bytes read from the
+# control pipe forks a child, which returns to run `main()`, and reports
+# the child's pid and, once it ended, its wait status.
+SHIM_SOURCE = r'''
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#define MAP_SIZE %(map_size)d
+#define MAX_PCS %(max_pcs)d
+#define SEEN_SIZE (4 * MAX_PCS)
+
+extern char __executable_start;
+
+static unsigned char *edges;
+static uint32_t *pc_count;
+static uint32_t *pcs;
+static uint32_t seen[SEEN_SIZE];
+static uint32_t prev;
+
+static void fork_server(int control, int status) {
+    uint32_t message = 0;
+    if (write(status, &message, 4) != 4)
+        return;
+    while (read(control, &message, 4) == 4) {
+        pid_t pid = fork();
+        if (pid < 0)
+            _exit(1);
+        if (pid == 0) {
+            close(control);
+            close(status);
+            return;
+        }
+        int wait_status;
+        if (write(status, &pid, 4) != 4 || waitpid(pid, &wait_status, 0) < 0 ||
+            write(status, &wait_status, 4) != 4)
+            _exit(1);
+    }
+    _exit(0);
+}
+
+__attribute__((constructor)) static void coverage_init(void) {
+    const char *path = getenv("%(variable)s");
+    if (path != NULL) {
+        int fd = open(path, O_RDWR);
+        if (fd >= 0) {
+            void *map = mmap(NULL, MAP_SIZE + 4 * (1 + MAX_PCS),
+                             PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+            close(fd);
+            if (map != MAP_FAILED) {
+                edges = map;
+                pc_count = (uint32_t *)(edges + MAP_SIZE);
+                pcs = pc_count + 1;
+            }
+        }
+    }
+    const char *fds = getenv("%(forkserver_variable)s");
+    if (fds != NULL) {
+        char *end;
+        int control = (int)strtol(fds, &end, 10);
+        if (*end == ',')
+            fork_server(control, (int)strtol(end + 1, NULL, 10));
+    }
+}
+
+void __sanitizer_cov_trace_pc(void) {
+    if (edges == NULL)
+        return;
+    uint32_t pc = (uint32_t)((uintptr_t)__builtin_return_address(0) -
+                             (uintptr_t)&__executable_start);
+    uint32_t hash = pc * 2654435761u;
+    uint32_t cur = hash >> 16 & (MAP_SIZE - 1);
+    if (edges[cur ^ prev] != 0xff)
+        edges[cur ^ prev]++;
+    prev = cur >> 1;
+
+    uint32_t key = pc + 1, slot = hash & (SEEN_SIZE - 1);
+    while (seen[slot] != key) {
+        if (seen[slot] == 0) {
+            seen[slot] = key;
+            if (*pc_count < MAX_PCS)
+                pcs[(*pc_count)++] = pc;
+            break;
+        }
+        slot = (slot + 1) & (SEEN_SIZE - 1);
+    }
+}
+'''
+
+ENVIRONMENT_VARIABLE = 'NATIVE_COVERAGE_MAP'
+FORKSERVER_VARIABLE = 'NATIVE_FORKSERVER_FDS'
+
+
+def compile_instrumented(sources: Union[str, Sequence[str]], executable: str,
+                         cflags: Sequence[str] = ('-O0', '-g')) -> str:
+    """Compile the C `sources` into `executable`, instrumented for
+    `NativeCoverageRunner` (GCC or Clang with `-fsanitize-coverage=trace-pc`).
+    Return `executable`."""
+    if isinstance(sources, str):
+        sources = [sources]
+    with tempfile.TemporaryDirectory() as directory:
+        shim = os.path.join(directory, 'coverage_shim.c')
+        with open(shim, 'w') as f:
+            f.write(SHIM_SOURCE % {'map_size': MAP_SIZE, 'max_pcs': MAX_PCS,
+                                   'variable': ENVIRONMENT_VARIABLE,
+                                   'forkserver_variable': FORKSERVER_VARIABLE})
+        shim_object = os.path.join(directory, 'coverage_shim.o')
+        subprocess.run(['cc', '-O2', '-fPIE', '-c', shim, '-o', shim_object],
+                       check=True)
+        # Position-independent, so addresses relative to the start of the
+        # executable are the addresses `addr2line` expects
+        subprocess.run(['cc', *cflags, '-fPIE', '-pie',
+                        '-fsanitize-coverage=trace-pc', *sources, shim_object,
+                        '-o', executable], check=True)
+    return executable
+
+
+class NativeCoverageRunner(ProgramRunner):
+    """Run a C program compiled with `compile_instrumented()` and collect
+    its coverage through shared memory, without gcov files.  The input is
+    passed as the last command line argument (`argument=True`, as
+    `cgi_decode` expects) or on standard input.  `coverage()` returns
+    (function_name, line_number) locations, as
+    `FunctionCoverageRunner.coverage()`, and `bitmap()` the edge map, which
+    `GreyboxFuzzer` uses for novelty.  Locations are recorded per basic
+    block, as the line where the block starts.  Use as
+    ```
+    compile_instrumented('coverage/cgi_decode.c', 'cgi_decode.cov')
+    runner = NativeCoverageRunner('./cgi_decode.cov')
+    ```
+    """
+
+    def __init__(self, program: Union[str, List[str]], argument: bool = True,
+                 timeout: Optional[float] = None,
+                 cpu_timeout: Optional[float] = None) -> None:
+        """Constructor.
+        `program` - the instrumented executable, with arguments if a list.
+        `argument` - pass the input as argument (default) or on stdin.
+        """
+        super().__init__(program, timeout, cpu_timeout)
+        self.command = [program] if isinstance(program, str) else list(program)
+        self.argument = argument
+
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, self.map_file = tempfile.mkstemp(prefix='coverage-', dir=directory)
+        size = MAP_SIZE + 4 * (1 + MAX_PCS)
+        os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        os.close(fd)
+        self._bitmap = EdgeBitmap(MAP_SIZE, memoryview(self._map)[:MAP_SIZE])
+        self.env = dict(os.environ, **{ENVIRONMENT_VARIABLE: self.map_file})
+
+        self._locations: Dict[int, Optional[Location]] = {}  # by address
+        self._coverage: Optional[Set[Location]] = None
+
+    def reset_coverage(self) -> None:
+        """Clear the shared map for the next run"""
+        self._bitmap.clear()
+        struct.pack_into('<I', self._map, MAP_SIZE, 0)
+        self._coverage = None
+
+    def run_process(self, inp: str = "") -> subprocess.CompletedProcess:
+        self.reset_coverage()
+        if self.argument:
+            # C strings end at the first NUL character
+            args = self.command + [inp.split('\0', 1)[0]]
+            stdin = None
+        else:
+            args = self.command
+            stdin = inp.encode()
+        return subprocess.run(args,
+                              input=stdin,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              env=self.env,
+                              timeout=self.timeout,
+                              preexec_fn=self.limit_cpu if self.cpu_timeout else None)
+
+    def addresses(self) -> List[int]:
+        """The addresses of the basic blocks hit in the last run"""
+        count = min(struct.unpack_from('<I', self._map, MAP_SIZE)[0], MAX_PCS)
+        return list(struct.unpack_from('<%dI' % count, self._map, MAP_SIZE + 4))
+
+    def resolve(self, addresses: Sequence[int]) -> None:
+        """Look up the source locations of `addresses` with `addr2line`"""
+        if not addresses:
+            return
+        output = subprocess.run(['addr2line', '-f', '-e', self.command[0]] +
+                                ['%x' % address for address in addresses],
+                                stdout=subprocess.PIPE, universal_newlines=True,
+                                check=True).stdout.splitlines()
+        for address, function, position in zip(addresses, output[0::2], output[1::2]):
+            # "file.c:12" or "file.c:12 (discriminator 3)"; "??:0" if unknown
+            lineno = position.split()[0].rpartition(':')[2]
+            if function == '??' or not lineno.isdigit() or lineno == '0':
+                self._locations[address] = None
+            else:
+                self._locations[address] = (function, int(lineno))
+
+    def coverage(self) -> Set[Location]:
+        if self._coverage is None:
+            addresses = self.addresses()
+            self.resolve([address for address in addresses
+                          if address not in self._locations])
+            locations = self._locations
+            self._coverage = {locations[address] for address in addresses
+                              if locations[address] is not None}  # type: ignore
+        return self._coverage
+
+    def bitmap(self) -> Optional[EdgeBitmap]:
+        """The edge map of the last run"""
+        return self._bitmap
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._bitmap = None  # type: ignore
+            self._map.close()
+            self._map = None  # type: ignore
+            os.unlink(self.map_file)
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _read_exactly(fd: int, size: int) -> bytes:
+    """Read exactly `size` bytes from `fd`; return b'' on EOF."""
+    chunks = []
+    while size > 0:
+        chunk = os.read(fd, size)
+        if not chunk:
+            return b''
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class ForkServerRunner(NativeCoverageRunner):
+    """Run a C program compiled with `compile_instrumented()` as an AFL-style
+    fork server: the program is started once, stops before `main()`, and
+    forks a child for every input, so neither `exec()` nor dynamic linking
+    nor the program's own setup happen per run.  The input is written to a
+    file that is the program's standard input; an argument "@@" in
+    `program` is replaced by the name of that file.  Inputs cannot be
+    passed as arguments.  Coverage is collected as in
+    `NativeCoverageRunner`.  Use as
+    ```
+    compile_instrumented('target.c', 'target.cov')
+    runner = ForkServerRunner('./target.cov')  # or ['./target.cov', '@@']
+    ```
+    """
+
+    def __init__(self, program: Union[str, List[str]],
+                 timeout: Optional[float] = None,
+                 cpu_timeout: Optional[float] = None,
+                 startup_timeout: float = 10.0) -> None:
+        """Constructor.
+        `program` - the instrumented executable, with arguments if a list.
+        `startup_timeout` - seconds to wait for the fork server to start.
+        """
+        super().__init__(program, argument=False, timeout=timeout,
+                         cpu_timeout=cpu_timeout)
+        self.startup_timeout = startup_timeout
+        fd, self.input_file = tempfile.mkstemp(prefix='input-',
+                                               dir=os.path.dirname(self.map_file))
+        self._files = [fd, tempfile.TemporaryFile(), tempfile.TemporaryFile()]
+        self._fds = [fd, self._files[1].fileno(), self._files[2].fileno()]
+        self.command = [self.input_file if arg == '@@' else arg
+                        for arg in self.command]
+        self.server: Optional[subprocess.Popen] = None
+        self.start()
+
+    def start(self) -> None:
+        """Start the fork server; raise RuntimeError if it does not report"""
+        control_r, control_w = os.pipe()
+        status_r, status_w = os.pipe()
+        env = dict(self.env, **{FORKSERVER_VARIABLE: '%d,%d' % (control_r, status_w)})
+        try:
+            self.server = subprocess.Popen(self.command, stdin=self._fds[0],
+                                           stdout=self._fds[1], stderr=self._fds[2],
+                                           env=env, pass_fds=(control_r, status_w))
+        finally:
+            os.close(control_r)
+            os.close(status_w)
+        self.control, self.status = control_w, status_r
+        ready, _, _ = select.select([status_r], [], [], self.startup_timeout)
+        if not ready or len(_read_exactly(status_r, 4)) != 4:
+            self.stop()
+            raise RuntimeError("%s did not start a fork server; compile it "
+                               "with compile_instrumented()" % self.command[0])
+
+    def stop(self) -> None:
+        """Stop the fork server"""
+        if self.server is None:
+            return
+        os.close(self.control)  # the server exits on EOF
+        os.close(self.status)
+        try:
+            self.server.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.server.kill()
+            self.server.wait()
+        self.server = None
+
+    def _read_int(self) -> int:
+        data = _read_exactly(self.status, 4)
+        if not data:
+            raise BrokenPipeError("fork server died")
+        return struct.unpack('<i', data)[0]
+
+    def fork(self) -> int:
+        """Have the server fork a child for the next run; return its pid"""
+        os.write(self.control, b'\0' * 4)
+        return self._read_int()
+
+    def run_process(self, inp: str = "") -> subprocess.CompletedProcess:
+        """Run the program with `inp` as input in a child of the fork
+           server.  Raise `subprocess.TimeoutExpired` if it was killed on
+           timeout."""
+        self.reset_coverage()
+        for fd in self._fds:
+            os.ftruncate(fd, 0)
+            os.lseek(fd, 0, os.SEEK_SET)
+        os.write(self._fds[0], inp.encode())
+        os.lseek(self._fds[0], 0, os.SEEK_SET)
+
+        try:
+            pid = self.fork()
+        except (BrokenPipeError, OSError):
+            # The server went away (e.g. killed); restart it once
+            self.stop()
+            self.start()
+            pid = self.fork()
+        if self.cpu_timeout:
+            import resource
+            seconds = math.ceil(self.cpu_timeout)
+            try:
+                resource.prlimit(pid, resource.RLIMIT_CPU, (seconds, seconds + 1))
+            except ProcessLookupError:
+                pass  # already done
+        timed_out = False
+        if self.timeout is not None:
+            ready, _, _ = select.select([self.status], [], [], self.timeout)
+            if not ready:
+                os.kill(pid, signal.SIGKILL)
+                timed_out = True
+        wait_status = self._read_int()
+        returncode = os.waitstatus_to_exitcode(wait_status)
+
+        out, err = [os.pread(fd, os.fstat(fd).st_size, 0) for fd in self._fds[1:]]
+        if timed_out:
+            raise subprocess.TimeoutExpired(self.command, self.timeout, out, err)
+        return subprocess.CompletedProcess(self.command, returncode, out, err)
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.stop()
+        if self._files:
+            os.close(self._files[0])
+            for f in self._files[1:]:
+                f.close()
+            self._files = []
+            os.unlink(self.input_file)
+        super().close()
+
+
+if __name__ == '__main__':
+    import time
+    from Greybox import GreyboxFuzzer, Mutator, PowerSchedule
+
+    executable = os.path.join(tempfile.gettempdir(), 'cgi_decode.cov')
+    compile_instrumented(os.path.join('coverage', 'cgi_decode.c'), executable)
+    runner = NativeCoverageRunner(executable)
+    print(runner.run("Hello+World%41"))
+    print(sorted(runner.coverage()))
+
+    fuzzer = GreyboxFuzzer(["Hello+World"], Mutator(), PowerSchedule())
+    start = time.perf_counter()
+    fuzzer.runs(runner, trials=1000)
+    elapsed = time.perf_counter() - start
+    print("%.1f execs/sec, %d seeds, %d edges" %
+          (1000 / elapsed, len(fuzzer.population), runner.bitmap().edges()))
+    runner.close()
@@ -0,0 +1,164 @@
+import os
+import pickle
+import random
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import List, Dict, Any, Optional, Tuple, Set
+from Greybox import GreyboxFuzzer, Seed, PowerSchedule
+from Fuzz import Runner
+from Coverage import Location, uses_interned_coverage
+
+
+def _frequency_delta(after: Dict, before: Dict) -> Dict:
+    """Path frequency counts added between `before` and `after`"""
+    return {path_id: count - before.get(path_id, 0)
+            for path_id, count in after.items()
+            if count != before.get(path_id, 0)}
+
+
+def _merge_frequency(path_frequency: Dict, delta: Dict) -> None:
+    for path_id, count in delta.items():
+        path_frequency[path_id] = path_frequency.get(path_id, 0) + count
+
+
+def _count_paths(schedule: PowerSchedule, delta: Dict) -> None:
+    for path_id, count in delta.items():
+        schedule.count_path(path_id, count)
+
+
+def _worker(fuzzer: GreyboxFuzzer, runner: Runner, conn: Connection) -> None:
+    """Worker loop: merge seeds found elsewhere, fuzz, report what's new."""
+    random.seed()  # forked workers must not share the parent's random state
+    fuzzer.inputs = []
+    fuzzer.corpus = None  # only the parent writes to a corpus directory
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        trials, seeds, frequency = message
+        for seed in seeds:
+            fuzzer.merge_seed(seed)
+        _count_paths(fuzzer.schedule, frequency)
+
+        known = len(fuzzer.population)
+        before = dict(fuzzer.schedule.path_frequency)
+        runs = fuzzer.cumulative.runs
+        outcomes = [fuzzer.run(runner) for i in range(trials)]
+
+        report = (fuzzer.population[known:],
+                  _frequency_delta(fuzzer.schedule.path_frequency, before),
+                  fuzzer.inputs,
+                  (fuzzer.cumulative.since(runs), fuzzer.cumulative.runs - runs))
+        try:
+            conn.send(report + (outcomes,))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            conn.send(report + ([(repr(result), outcome)
+                                 for result, outcome in outcomes],))
+        fuzzer.inputs = []
+    conn.close()
+
+
+class ParallelFuzzer:
+    """Run a `GreyboxFuzzer` campaign on several worker processes.
+
+    Every worker is a forked copy of `fuzzer` that mutates and executes
+    inputs on its own.  Every `sync_every` trials, the workers report newly
+    discovered seeds, path frequencies, inputs and the coverage they reached
+    first (see `GreyboxFuzzer.population_coverage()`); these are merged into
+    `fuzzer` (the shared corpus) and sent on to all other workers.  The
+    initial seeds are run in the parent, before the workers are forked.
+    Use as
+    ```
+    fuzzer = CountingGreyboxFuzzer([seed], Mutator(), AFLFastSchedule(5))
+    ParallelFuzzer(fuzzer, processes=8).runs(runner, trials=100000)
+    fuzzer.population  # merged corpus
+    ```
+    """
+
+    def __init__(self, fuzzer: GreyboxFuzzer, processes: Optional[int] = None,
+                 sync_every: int = 500) -> None:
+        """Constructor.
+        `fuzzer` - the fuzzer holding the shared corpus.
+        `processes` - the number of worker processes (default: all cores).
+        `sync_every` - the number of trials each worker runs between syncs.
+        """
+        self.fuzzer = fuzzer
+        self.processes = processes or os.cpu_count() or 1
+        self.sync_every = sync_every
+
+    def merge(self, seeds: List[Seed], frequency: Dict, inputs: List[str],
+              cumulative: Tuple[List[Tuple[int, Set[Location]]], int]) -> List[Seed]:
+        """Merge one worker's report into the shared corpus.  `cumulative`
+           holds the worker's `CumulativeCoverage.since()` steps and runs.
+           Return the seeds that were new to the corpus."""
+        new_seeds = [seed for seed in seeds if self.fuzzer.merge_seed(seed)]
+        _count_paths(self.fuzzer.schedule, frequency)
+        self.fuzzer.inputs.extend(inputs)
+        self.fuzzer.cumulative.merge(*cumulative)
+        return new_seeds
+
+    def runs(self, runner: Runner, trials: int = 10) -> List[Tuple[Any, str]]:
+        """Run `trials` trials in total, spread over all workers.  Return the
+           (result, outcome) pairs of all trials, by sync round and worker;
+           results the workers cannot send back are given as their `repr()`."""
+        if uses_interned_coverage(runner):
+            # Every worker would assign its own ids to new locations
+            raise ValueError("InternedCoverage ids are per process; "
+                             "use SetCoverage with ParallelFuzzer")
+        context = multiprocessing.get_context('fork')
+        connections: List[Connection] = []
+        workers = []
+        # Run the initial seeds once, so that all workers start from them
+        outcomes: List[Tuple[Any, str]] = []
+        while self.fuzzer.seed_index < len(self.fuzzer.seeds) and trials > 0:
+            outcomes.append(self.fuzzer.run(runner))
+            trials -= 1
+
+        for i in range(self.processes):
+            parent_conn, child_conn = context.Pipe()
+            worker = context.Process(target=_worker,
+                                     args=(self.fuzzer, runner, child_conn),
+                                     daemon=True)
+            worker.start()
+            child_conn.close()
+            connections.append(parent_conn)
+            workers.append(worker)
+
+        # What each worker has not seen yet: seeds and frequency deltas
+        pending: List[Tuple[List[Seed], Dict[Any, int]]] = [
+            ([], {}) for conn in connections]
+        remaining = trials
+        try:
+            while remaining > 0:
+                batch = min(self.sync_every,
+                            -(-remaining // len(connections)))
+                active = []
+                for conn, (seeds, frequency) in zip(connections, pending):
+                    if remaining <= 0:
+                        break
+                    n = min(batch, remaining)
+                    remaining -= n
+                    conn.send((n, seeds, frequency))
+                    active.append(conn)
+                    self.fuzzer.trials += n
+
+                reports = [conn.recv() for conn in active]
+                pending = [([], {}) for conn in connections]
+                for origin, (seeds, frequency, inputs, cumulative,
+                             worker_outcomes) in enumerate(reports):
+                    new_seeds = self.merge(seeds, frequency, inputs, cumulative)
+                    outcomes.extend(worker_outcomes)
+                    for target, (target_seeds, target_frequency) in enumerate(pending):
+                        if target == origin:
+                            continue
+                        target_seeds.extend(new_seeds)
+                        _merge_frequency(target_frequency, frequency)
+                if self.fuzzer.corpus is not None:
+                    self.fuzzer.corpus.tick(self.fuzzer)
+        finally:
+            for conn in connections:
+                conn.send(None)
+                conn.close()
+            for worker in workers:
+                worker.join()
+        return outcomes
@@ -0,0 +1,250 @@
+import copy
+import pickle
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import List, Dict, Any, Optional, Tuple, Callable, Sequence, FrozenSet, Type
+from Fuzz import Runner
+from Coverage import Coverage, Location, uses_interned_coverage
+from Crash import Frame, exception_frames
+
+# Objects and the names of their attributes to restore after every input
+State = Sequence[Tuple[Any, Sequence[str]]]
+
+
+def _max_rss() -> int:
+    """Peak resident set size of this process, in bytes (Linux)"""
+    import resource  # Unix only
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker(function: Callable, coverage_class: Optional[Type[Coverage]],
+            coverage_args: Dict[str, Any],
+            reset: Sequence[Callable[[], None]], state: State,
+            conn: Connection) -> None:
+    """Persistent loop: run `function` on every input received, reset the
+    declared state, and report the result."""
+    saved = [(obj, name, copy.deepcopy(getattr(obj, name)))
+             for obj, names in state for name in names]
+    # Most inputs take a path seen before; those are sent as a number only
+    paths: Dict[FrozenSet[Location], int] = {}
+    while True:
+        try:
+            inp = conn.recv()
+        except EOFError:
+            break
+        if inp is None:
+            break
+
+        result = None
+        exception = None
+        coverage = None
+        if coverage_class is None:
+            try:
+                result = function(inp)
+            except Exception as exc:
+                exception = exc
+        else:
+            with coverage_class(**coverage_args) as cov:
+                try:
+                    result = function(inp)
+                except Exception as exc:
+                    exception = exc
+            path = frozenset(cov.coverage())
+            path_id = paths.get(path)
+            if path_id is None:
+                path_id = paths[path] = len(paths)
+                coverage = (path_id, path)
+            else:
+                coverage = (path_id, None)
+
+        if exception is None:
+            outcome, failure = Runner.PASS, None
+        else:
+            outcome = Runner.FAIL
+            failure = (type(exception).__name__, exception_frames(exception))
+        exception = None  # release the frames
+
+        for obj, name, value in saved:
+            setattr(obj, name, copy.deepcopy(value))
+        for hook in reset:
+            hook()
+
+        try:
+            conn.send((result, outcome, failure, coverage, _max_rss()))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            conn.send((repr(result), outcome, failure, coverage, _max_rss()))
+    conn.close()
+
+
+class PersistentRunner(Runner):
+    """Run a Python function in persistent mode: a forked worker process
+    loops over inputs sent to it, so the target module is imported and set
+    up only once, while crashes, hangs and leaks stay out of the fuzzer.
+
+    After every input, the worker restores the attributes declared in
+    `state` to their values at worker start and calls the `reset` hooks.
+    The worker is replaced by a fresh one every `iterations` inputs, when
+    its peak memory grew by more than `max_rss_growth` bytes, and after
+    it died or timed out.  Use as
+    ```
+    runner = PersistentRunner(my_parser, coverage_class=SetCoverage)
+    fuzzer.runs(runner, trials=10000)
+    ```
+    """
+
+    def __init__(self, function: Callable,
+                 coverage_class: Optional[Type[Coverage]] = None,
+                 reset: Sequence[Callable[[], None]] = (),
+                 state: State = (),
+                 iterations: int = 10000,
+                 max_rss_growth: int = 64 * 1024 * 1024,
+                 timeout: Optional[float] = None,
+                 include: Optional[Sequence[str]] = None,
+                 exclude: Optional[Sequence[str]] = None) -> None:
+        """Constructor.
+        `coverage_class` - record coverage with this class (default: none).
+        `reset` - functions to call in the worker after every input.
+        `state` - (object, attribute names) pairs to restore after every input.
+        `iterations` - the number of inputs after which to recycle the worker.
+        `max_rss_growth` - the peak memory growth (bytes) to recycle at.
+        `timeout` - wall clock seconds after which the worker is killed.
+        `include`, `exclude` - the modules or files to trace (see `Scope`).
+        """
+        self.function = function
+        self.coverage_class = coverage_class
+        if uses_interned_coverage(self):
+            # Every (restarted) worker would assign its own ids
+            raise ValueError("InternedCoverage ids are per process; "
+                             "use SetCoverage with PersistentRunner")
+        self.coverage_args = {'include': include, 'exclude': exclude}
+        self.reset = list(reset)
+        self.state = list(state)
+        self.iterations = iterations
+        self.max_rss_growth = max_rss_growth
+        self.timeout = timeout
+
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn: Optional[Connection] = None
+        self.served = 0
+        self.base_rss = 0
+        self.restarts = 0
+
+        self.exception = None  # exceptions stay in the worker; see `failure`
+        self.failure: Optional[Tuple[str, List[Frame]]] = None
+        self.signal: Optional[int] = None
+        self._coverage: FrozenSet[Location] = frozenset()
+        self._paths: List[FrozenSet[Location]] = []  # by worker path id
+
+    def start(self) -> None:
+        """Fork a fresh worker"""
+        context = multiprocessing.get_context('fork')
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker,
+            args=(self.function, self.coverage_class, self.coverage_args,
+                  self.reset, self.state, child_conn),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.served = 0
+        self.base_rss = 0
+        self._paths = []
+
+    def stop(self, kill: bool = False) -> Optional[int]:
+        """Stop the worker; return its exit code"""
+        if self.process is None:
+            return None
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.conn.close()
+        self.process.join()
+        exitcode = self.process.exitcode
+        self.process = None
+        self.conn = None
+        return exitcode
+
+    def restart(self, kill: bool = False) -> Optional[int]:
+        exitcode = self.stop(kill)
+        self.restarts += 1
+        self.start()
+        return exitcode
+
+    def run(self, inp: str) -> Tuple[Any, str]:
+        if self.process is None:
+            self.start()
+        self.failure = None
+        self.signal = None
+        self._coverage = frozenset()
+
+        try:
+            self.conn.send(inp)
+        except OSError:  # the worker died between inputs
+            self.restart(kill=True)
+            self.conn.send(inp)
+
+        if self.timeout is not None and not self.conn.poll(self.timeout):
+            self.restart(kill=True)
+            return (None, self.TIMEOUT)
+        try:
+            result, outcome, self.failure, coverage, rss = self.conn.recv()
+        except EOFError:
+            # The worker crashed (e.g. a segfault in an extension module)
+            exitcode = self.restart(kill=True)
+            if exitcode is not None and exitcode < 0:
+                self.signal = -exitcode
+            return (None, self.FAIL)
+
+        if coverage is not None:
+            path_id, path = coverage
+            if path is not None:
+                self._paths.append(path)
+            self._coverage = self._paths[path_id]
+        self.served += 1
+        if self.base_rss == 0:
+            self.base_rss = rss
+        if (self.served >= self.iterations or
+                rss - self.base_rss > self.max_rss_growth):
+            self.restart()
+        return (result, outcome)
+
+    def coverage(self) -> FrozenSet[Location]:
+        return self._coverage
+
+    def close(self) -> None:
+        self.stop()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+if __name__ == '__main__':
+    import time
+    from Coverage import SetCoverage
+    from Mutation import FunctionRunner, FunctionCoverageRunner
+    from html.parser import HTMLParser
+
+    def my_parser(inp: str) -> None:
+        parser = HTMLParser()
+        parser.feed(inp)
+
+    inputs = ["<html><body><a href='x'>link</a></body></html>"] * 2000
+    runners = [FunctionRunner(my_parser),
+               PersistentRunner(my_parser),
+               FunctionCoverageRunner(my_parser, SetCoverage),
+               PersistentRunner(my_parser, coverage_class=SetCoverage)]
+    for runner in runners:
+        start = time.perf_counter()
+        for inp in inputs:
+            runner.run(inp)
+        elapsed = time.perf_counter() - start
+        print("%-24s %8.1f execs/sec" %
+              (type(runner).__name__, len(inputs) / elapsed))